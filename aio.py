@@ -0,0 +1,209 @@
+"""
+Async engine: every Stock of a batch fetched on one event loop.
+
+The scrapers in stock.py are generators of transport.Fetch, so the code the
+threads run on blocking requests runs here unchanged on one aiohttp session
+and gives the same Stock. Every host gets a semaphore bounding its requests
+in flight, so one process keeps hundreds of fetches going across many
+tickers while no site sees more than per_host at once. Retries, rate limits,
+block page detection, the http cache and the recorder are the sync transport's.
+
+    stocks = asyncio.run(aio.fetch_all(['airasia', 'nestle']))
+
+Needs aiohttp (pip install aiohttp).
+"""
+import time
+import types
+import codecs
+import asyncio
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+from stock import Stock
+from transport import transport, blocked, check_page, failed, Blocked, RETRY_STATUS, CHUNK, BLOCK_PAGE
+from instrument import recorder, current_stock, current_source
+
+
+class AsyncTransport:
+    def __init__(self, sync=transport, per_host=8, limit=256):
+        if aiohttp is None:
+            raise ImportError("the async engine needs aiohttp: pip install aiohttp")
+        self.sync = sync  # retries, backoff, timeout, headers, rate limits and cache
+        self.per_host = per_host  # requests in flight per host
+        self.limit = limit  # connections open in total
+        self.semaphores = {}
+        self.session = None
+
+    async def __aenter__(self):
+        timeout = self.sync.timeout
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.limit),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+            headers=self.sync.headers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.semaphores[host]
+
+    async def run(self, steps):
+        """drive a scraper generator like Transport.run, awaiting the answer to every Fetch"""
+
+        if not isinstance(steps, types.GeneratorType):
+            return steps
+        try:
+            fetch = next(steps)
+            while True:
+                fetch = steps.send(await self.answer(fetch))
+        except StopIteration as stop:
+            return stop.value
+
+    async def answer(self, fetch):
+        with recorder.stage('fetch', host=urlsplit(fetch.url).netloc) as record:
+            key, entry, response, headers = self.sync.lookup(fetch.method, fetch.url, fetch.headers,
+                                                             fetch.params, fetch.data)
+            fields = None
+            if response is None:
+                # a cached body has to be read whole anyway, stream only without a cache
+                until = fetch.until if self.sync.cache is None else None
+                response, fields = await self.send(fetch, headers, until)
+                response = self.sync.store(key, entry, fetch.url, response)
+            self.sync.record(record, response, fields is not None)
+        if fetch.until is None:
+            return response
+        if fields is None:
+            fields = fetch.until.extract_chunks(response.iter_content(chunk_size=CHUNK, decode_unicode=True))
+        return fields
+
+    async def send(self, fetch, headers, until=None):
+        """(requests.Response, None), or with until (response without its body, until's fields of the streamed body)"""
+
+        prepared = requests.Request(fetch.method, fetch.url, headers=headers, params=fetch.params,
+                                    data=fetch.data).prepare()
+        url = yarl.URL(prepared.url, encoded=True)  # same url, headers and body as requests sends
+        headers = {key: value for key, value in prepared.headers.items() if key.lower() != 'content-length'}
+        ssl = fetch.kwargs.get('verify', True)
+        limiter = self.sync.rate_limiter
+        for attempt in range(self.sync.retries + 1):
+            await asyncio.sleep(limiter.reserve(fetch.url))
+            start = time.monotonic()
+            try:
+                async with self.semaphore(fetch.url):
+                    async with self.session.request(fetch.method, url, headers=headers, data=prepared.body,
+                                                    ssl=ssl) as r:
+                        response = self.response(r, b'' if until is not None else await r.read(), attempt)
+                        reason = blocked(response, until is not None)
+                        fields = None
+                        if reason is None and until is not None and r.status not in RETRY_STATUS:
+                            try:
+                                fields = await self.stream(r, until)
+                            except Blocked as e:
+                                reason = str(e)
+                        limiter.feedback(fetch.url, r.status, time.monotonic() - start, reason,
+                                         self.sync.retry_after(response))
+                        if (reason is None and r.status not in RETRY_STATUS) or attempt == self.sync.retries:
+                            if reason is not None:
+                                raise Blocked(f"{fetch.method} {fetch.url}: {reason}")
+                            if failed(response):
+                                response.raise_for_status()
+                            return response, fields
+                        delay = self.sync.delay(attempt, response)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                limiter.feedback(fetch.url, None, time.monotonic() - start)
+                if attempt == self.sync.retries:
+                    raise
+                delay = self.sync.delay(attempt)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def stream(r, until, overlap=256):
+        """until's regex fields, reading the body only until they all matched, like Spec.extract_chunks"""
+
+        decoder = codecs.getincrementaldecoder(r.charset or 'utf-8')(errors='replace')
+        result = {}
+        tail = ''
+        start = ''
+        whole = True
+        async for chunk in r.content.iter_chunked(CHUNK):
+            chunk = decoder.decode(chunk)
+            if len(start) < BLOCK_PAGE:
+                start += chunk[:BLOCK_PAGE - len(start)]
+            text = tail + chunk
+            if until.search_chunk(result, text):
+                whole = False
+                break
+            tail = text[-overlap:]
+        check_page(start, whole and len(start) < BLOCK_PAGE)
+        return until.complete(result)
+
+    @staticmethod
+    def response(r, body, attempt):
+        """requests.Response of an aiohttp response, so scrapers and the cache see no difference"""
+
+        response = requests.Response()
+        response.url = str(r.url)
+        response.status_code = r.status
+        response.reason = r.reason
+        response.headers = requests.structures.CaseInsensitiveDict(r.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.retries = attempt
+        return response
+
+
+async def load(client, stock, source):
+    """scrape one source, like Stock.load"""
+
+    current_stock.set(stock.company)
+    current_source.set(source)
+    with recorder.stage('scrape'):
+        await client.run(getattr(stock, 'load_' + source)())
+
+
+async def fetch(client, stock, sources=None):
+    """load sources as tasks, each one as soon as the sources it depends on are loaded, like Stock.fetch"""
+
+    tasks = {}
+
+    async def load_after(source, deps):
+        await asyncio.gather(*(tasks[i] for i in deps))
+        await load(client, stock, source)
+
+    for source, deps in stock.plan(sources).items():
+        tasks[source] = asyncio.create_task(load_after(source, deps))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+
+async def scrape(client, company, sources=None):
+    """Stock of a company with every source, or the given ones, loaded"""
+
+    my_stock = Stock(company, sources=[])
+    await fetch(client, my_stock, sources)
+    return my_stock
+
+
+async def fetch_all(companies, per_host=8, limit=256, sync=transport):
+    """{company: Stock, or the exception that stopped it} of every company, all on one event loop"""
+
+    async with AsyncTransport(sync, per_host, limit) as client:
+        results = await asyncio.gather(*(scrape(client, company) for company in companies), return_exceptions=True)
+    return dict(zip(companies, results))
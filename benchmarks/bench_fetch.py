@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Benchmark Stock construction against local stub servers with injected latency.
+
+    python benchmarks/bench_fetch.py --latency 0.2 --workers 1 8
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+import warnings
+warnings.filterwarnings("ignore")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stock import Stock
+import stub
+
+
+def time_stock(company, workers, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            Stock(company, max_workers=workers)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds added to every stub response")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--company', default='airasia')
+    args = parser.parse_args()
+
+    with stub.serve(args.latency) as counter:
+        with contextlib.redirect_stdout(io.StringIO()):
+            Stock(args.company)
+        requests_per_stock = counter['requests']
+
+        print(f"latency {args.latency:.3f}s, {requests_per_stock} requests per stock")
+        baseline = None
+        for workers in args.workers:
+            best = time_stock(args.company, workers, args.repeat)
+            baseline = baseline or best
+            print(f"workers={workers:<3} {best:7.3f}s  {baseline / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+Offline benchmarks of every stage of the pipeline, tracked across commits.
+
+Parsing and extraction run straight on the recorded pages in fixtures/, the
+scrapers and analyse run against the stub servers with no added latency, so
+the timings are cpu time of this code and never depend on the live sites.
+
+    python benchmarks/bench_suite.py                 # run, save and compare with the last commit
+    python benchmarks/bench_suite.py -k extract      # only benchmarks with 'extract' in the name
+    python benchmarks/bench_suite.py --compare HEAD~3 --check
+
+Every run is appended to benchmarks/results.jsonl under the git commit it
+ran on; the file is git-ignored, its timings are only comparable on the
+machine that made them. The median of each benchmark is compared with the
+latest runs of another commit (or --compare), and slowdowns beyond
+--threshold are flagged; with --check they fail the run, like a startup.* benchmark over
+its STARTUP_BUDGETS: the short scrape.py commands run from cron and shell
+loops, so their import time is what they cost.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import pickle
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+import contextlib
+import subprocess
+import warnings
+warnings.filterwarnings("ignore")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+import dcf
+import scrape
+import report
+import history
+from store import Store, COLUMNS, fundamentals
+from screener import Screener
+from symbols import Symbols
+from statements import Statement, Fundamentals
+from stock import Stock, Webpage, LINK, GROWTH, BETA, I3SUMMARY, OVERVIEW
+from cache import HttpCache
+from transport import transport, blocked
+from scheduler import Scheduler
+import stub
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+
+# seconds a whole `python scrape.py ...` process may take, interpreter start included
+STARTUP_BUDGETS = {
+    'startup.help': 0.25,
+    'startup.resolve': 0.25,
+    'startup.report': 0.25,
+}
+
+
+def fixture(name):
+    with open(os.path.join(stub.FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def chunks(text, size=16 * 1024):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def measure(function, repeat, min_time=0.05):
+    """seconds per call of function, median and min over repeat rounds of enough calls to last min_time"""
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1000:
+            break
+        number *= 2
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(timings), 'min': min(timings), 'number': number}
+
+
+def command(*args):
+    """run scrape.py as a process in the working directory"""
+
+    subprocess.run([sys.executable, os.path.join(ROOT, 'scrape.py'), *args], check=True, capture_output=True)
+
+
+def price_histories():
+    """(stock, market) price records of the fixtures, oldest first like History keeps them"""
+
+    return tuple(np.sort(history.parse_prices(stub.history_table(
+        {'curr_id': [curr_id], 'st_date': ['01/01/2016'], 'end_date': ['12/31/2026']}).decode()), order='date')
+        for curr_id in ['41688', stub.MARKET_ID])
+
+
+def check():
+    """assert what the benchmarks time computes the right thing, a fast wrong answer isn't a speedup"""
+
+    rates = dcf.discount_rate([0.8, 1.0, 1.51, np.nan])
+    assert np.allclose(rates[:3], [0.05, 0.06, 0.09]) and np.isnan(rates[3]), rates
+    assert dcf.discount_rate(0.8) == 0.05 and dcf.discount_rate(1.0) == 0.06 and dcf.discount_rate(1.51) == 0.09
+    prices, market = price_histories()
+    _, returns, market_returns = history.align([prices] * 2, market)
+    betas = history.rolling_beta(returns, market_returns)
+    assert np.isfinite(betas).any(), "rolling beta of the fixture prices is all nan"
+
+
+def benchmarks(stock):
+    """name -> function to time, stock is a Stock loaded from the stub servers, run in an empty directory"""
+
+    pages = {name: fixture(f'{name}.html') for name in
+             ['investing_search', 'investing_overview', 'investing_ratios', 'investing_cas', 'investing_bal',
+              'investing_earnings', 'simplywallst', 'infront_beta', 'i3_summary']}
+    year = stub.history_table({'curr_id': ['41688'], 'st_date': ['01/01/2025'], 'end_date': ['12/31/2025']}).decode()
+    prices, market = price_histories()
+    _, watchlist, market_returns = history.align([prices] * 200, market)
+    betas = np.linspace(0.2, 2.5, 1000)
+    cas = Webpage(pages['investing_cas']).table(0)
+    overview = HttpCache.response({'url': '', 'status': 200, 'headers': {}, 'encoding': 'utf-8'},
+                                  pages['investing_overview'].encode())
+    cases = {
+        'webpage.overview.soup': lambda: Webpage(pages['investing_overview']).soup,
+        'webpage.ratios.tables': lambda: Webpage(pages['investing_ratios']).tables,
+        'webpage.cas.table': lambda: Webpage(pages['investing_cas']).table(0),
+        'webpage.bal.table': lambda: Webpage(pages['investing_bal']).table(0),
+        'extract.link': lambda: LINK.extract(pages['investing_search']),
+        'extract.overview': lambda: OVERVIEW.extract(pages['investing_overview']),
+        'extract.growth': lambda: GROWTH.extract(pages['simplywallst']),
+        'extract.beta': lambda: BETA.extract_chunks(chunks(pages['infront_beta'])),
+        'extract.i3summary': lambda: I3SUMMARY.extract(pages['i3_summary']),
+        'statement.cash_flow': lambda: Statement.from_periods(cas),
+        'statement.pickle': lambda: pickle.loads(pickle.dumps(Fundamentals.of(stock))),
+        'history.parse_prices': lambda: history.parse_prices(year),
+        'history.parse_earnings': lambda: history.parse_earnings(pages['investing_earnings']),
+        'history.beta': lambda: history.beta(prices, market),
+        'history.rolling_beta.200': lambda: history.rolling_beta(watchlist, market_returns),
+        'transport.blocked': lambda: blocked(overview),
+        'scrape.link': lambda: transport.run(stock.scrape_link(stock.company)),
+    }
+    for source in Stock.sources:
+        if source != 'link':
+            cases[f'scrape.{source}'] = lambda scrape=getattr(stock, 'scrape_' + source): transport.run(scrape())
+    cases.update({
+        'search.ratios': lambda: scrape.search('P/E Ratio', stock.ratios),
+        'search.balance_sheet': lambda: scrape.search('Total Assets', stock.balance_sheet),
+        'dcf.valuation': lambda: dcf.valuation(stock),
+        'dcf.discount_rate.1000': lambda: dcf.discount_rate(betas),
+        'dcf.sensitivity': lambda: dcf.sensitivity(*dcf.inputs(stock), stock.growth_rate + report.growth_offsets,
+                                                   report.discount_rates),
+        'analyse': lambda: scrape.analyse(stock.company),
+        'scheduler.fetch_all.4': lambda: Scheduler(workers=16).fetch_all(['airasia', 'nestle', 'maybank', 'genting']),
+    })
+
+    # the startup commands read what an earlier run left in stocks.db
+    symbols, store = Symbols('stocks.db'), Store('stocks.db')
+    symbols.put(stock.company, 'stock_cd', stock.stock_cd)
+    store.save(stock)
+    symbols.close()
+    store.close()
+    # an exchange of 1000 stocks, the fixture's figures scaled at random
+    rng = np.random.default_rng(0)
+    exchange = pd.DataFrame([fundamentals(stock)] * 1000, dtype=float)
+    exchange = exchange * rng.normal(1, 0.8, exchange.shape)
+    exchange.insert(0, 'stock_cd', [f"stock-{i}" for i in range(1000)])
+    exchange.insert(1, 'date', datetime.date.today().isoformat())
+    exchange.insert(2, 'company', exchange.stock_cd)
+    screen_store = Store('exchange.db')
+    exchange[['stock_cd', 'date', 'company'] + COLUMNS].to_sql('fundamentals', screen_store.connection,
+                                                               if_exists='append', index=False)
+    screener = Screener.from_store(screen_store)
+    cases.update({
+        'screen.load.1000': lambda: Screener.from_store(screen_store),
+        'screen.1000': lambda: screener.screen("roe > 0.1 and pb < 1 and lt_debt_to_equity < 1", top=20),
+        'screen.rank.1000': lambda: screener.screen(rank="roe / pe + dividend_yield"),
+    })
+    cases.update({
+        'startup.help': lambda: command('-h'),
+        'startup.resolve': lambda: command('resolve', stock.company),
+        'startup.report': lambda: command('report', stock.company),
+    })
+    return cases
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_runs():
+    if not os.path.exists(RESULTS):
+        return []
+    with open(RESULTS) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(runs, commit, ref=None):
+    """(commit, {name: result}) of the latest runs of ref, or of the latest commit other than this one"""
+
+    if ref is not None:
+        wanted = git('rev-parse', ref)
+    else:
+        wanted = next((run['commit'] for run in reversed(runs) if run['commit'] != commit), None)
+    results = {}
+    for run in runs:
+        if run['commit'] == wanted:
+            results.update(run['results'])
+    return (wanted, results) if results else (None, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='pattern', default='', help="only run benchmarks with this in their name")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--company', default='airasia')
+    parser.add_argument('--compare', metavar='REF', help="git ref to compare with, default the last other commit")
+    parser.add_argument('--threshold', type=float, default=0.15, help="slowdown flagged as a regression")
+    parser.add_argument('--check', action='store_true', help="exit 1 on any regression")
+    parser.add_argument('--no-save', action='store_true', help="don't append this run to results.jsonl")
+    args = parser.parse_args()
+
+    check()
+    commit = git('rev-parse', 'HEAD')
+    results = {}
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)  # analyse writes its workbooks in the working directory
+    try:
+        with stub.serve(0), contextlib.redirect_stdout(io.StringIO()):
+            stock = Stock(args.company)
+            cases = {name: case for name, case in benchmarks(stock).items() if args.pattern in name}
+            for name, case in cases.items():
+                results[name] = measure(case, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base, previous = baseline(load_runs(), commit, args.compare)
+    if base:
+        print(f"compared with {base[:10]}")
+
+    regressions = []
+    print(f"{'benchmark':<26} {'median':>10} {'min':>10} {'change':>8}")
+    for name, result in results.items():
+        line = f"{name:<26} {result['median'] * 1000:>8.3f}ms {result['min'] * 1000:>8.3f}ms"
+        if name in previous:
+            change = result['median'] / previous[name]['median'] - 1
+            line += f" {change:>+7.1%}"
+            if change > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        if name in STARTUP_BUDGETS and result['median'] > STARTUP_BUDGETS[name]:
+            line += f"  OVER BUDGET ({STARTUP_BUDGETS[name] * 1000:.0f}ms)"
+            regressions.append(name)
+        print(line)
+
+    if not args.no_save:
+        run = {
+            'commit': commit,
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.node(),
+            'results': results,
+        }
+        with open(RESULTS, 'a') as f:
+            f.write(json.dumps(run) + "\n")
+
+    if regressions and args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Local stub servers standing in for the scraped sites.
+
+Every scraped host gets its own http server on 127.0.0.1 that answers from
+the recorded pages in fixtures/ after an injected latency. `serve()` points
+all requests sessions, and aiohttp sessions when it is installed, at the
+stub servers while it is active. With blocks, the first requests to every
+host get CAPTCHA, like a site that took the scraper for a bot.
+"""
+import os
+import csv
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+MARKET_ID = '29078'  # history.MARKET, every other pair id gets the stock's prices
+
+
+def history_table(form):
+    """investing.com historical data table of the fixture prices between st_date and end_date, newest first"""
+
+    name = 'history_market.csv' if form['curr_id'][0] == MARKET_ID else 'history_stock.csv'
+    start, end = (datetime.datetime.strptime(form[key][0], '%m/%d/%Y').date() for key in ['st_date', 'end_date'])
+    rows = []
+    with open(os.path.join(FIXTURES, name)) as f:
+        for row in csv.DictReader(f):
+            date = datetime.date.fromisoformat(row['date'])
+            if start <= date <= end:
+                epoch = int(datetime.datetime(date.year, date.month, date.day, tzinfo=datetime.timezone.utc).timestamp())
+                rows.append(
+                    f'<tr><td class="first left bold noWrap" data-real-value="{epoch}">{date:%b %d, %Y}</td>'
+                    + ''.join(f'<td data-real-value="{row[key]}">{row[key]}</td>' for key in ['close', 'open', 'high', 'low'])
+                    + f'<td data-real-value="{row["volume"]}">{int(row["volume"]) / 1e6:.2f}M</td>'
+                    + '<td class="bold">0.00%</td></tr>')
+    body = ('<div id="results_box"><table class="genTbl closedTbl historicalTbl" id="curr_table"><thead><tr>'
+            '<th>Date</th><th>Price</th><th>Open</th><th>High</th><th>Low</th><th>Vol.</th><th>Change %</th>'
+            '</tr></thead><tbody>' + ''.join(reversed(rows)) + '</tbody></table></div>')
+    return body.encode()
+
+
+def route(host, path, query, form):
+    """fixture file that answers a request, or the body itself"""
+
+    if host == 'www.investing.com':
+        if path == '/search/':
+            return 'investing_search.html'
+        if path == '/instruments/HistoricalDataAjax':
+            return history_table(form)
+        if path == '/equities/morehistory':
+            return 'investing_morehistory.json'
+        if path.endswith('-earnings'):
+            return 'investing_earnings.html'
+        if path.endswith('changereporttypeajax'):
+            return {'CAS': 'investing_cas.html', 'BAL': 'investing_bal.html'}[query['report_type'][0]]
+        if path.endswith('-ratios'):
+            return 'investing_ratios.html'
+        return 'investing_overview.html'
+    if host == '17iqhzwxzw-dsn.algolia.net':
+        return 'algolia.json'
+    if host == 'simplywall.st':
+        return 'simplywallst.html'
+    if host == 'www.infrontanalytics.com':
+        if path.endswith('autocomplete'):
+            return 'infront_autocomplete.json'
+        return 'infront_beta.html'
+    if host == 'klse.i3investor.com':
+        if path == '/cmservlet.jsp':
+            return 'i3_lookup.txt'
+        if path == '/quoteservlet.jsp':
+            return 'i3_quote.html'
+        return 'i3_summary.html'
+    return None
+
+
+CAPTCHA = (b'<html><head><title>Just a moment...</title></head><body>'
+           b'<div class="g-recaptcha" data-sitekey="stub"></div></body></html>')
+
+HOSTS = ['www.investing.com', '17iqhzwxzw-dsn.algolia.net', 'simplywall.st',
+         'www.infrontanalytics.com', 'klse.i3investor.com']
+
+
+def make_handler(host, latency, counter, blocks=0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def respond(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            form = parse_qs(self.rfile.read(length).decode()) if length else {}
+            url = urlsplit(self.path)
+            name = route(host, url.path, parse_qs(url.query), form)
+            with counter['lock']:
+                counter['requests'] += 1
+                counter[host] = counter.get(host, 0) + 1
+                blocked = counter[host] <= blocks
+            time.sleep(latency)
+            if blocked:
+                name = body = CAPTCHA
+                self.send_response(200)
+            elif name is None:
+                body = b'not found'
+                self.send_response(404)
+            elif isinstance(name, bytes):
+                body = name
+                self.send_response(200)
+            else:
+                with open(os.path.join(FIXTURES, name), 'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+            content_type = 'application/json' if isinstance(name, str) and name.endswith('.json') else 'text/html; charset=utf-8'
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = respond
+        do_POST = respond
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients that stop reading early reset the connection
+
+
+@contextmanager
+def serve(latency=0.05, blocks=0):
+    """run one stub server per host and redirect requests to them"""
+
+    counter = {'requests': 0, 'lock': threading.Lock()}
+    servers = {}
+    for host in HOSTS:
+        server = Server(('127.0.0.1', 0), make_handler(host, latency, counter, blocks))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[host] = server
+
+    def redirect(url):
+        parts = urlsplit(url)
+        server = servers.get(parts.netloc)
+        if server is not None:
+            url = f"http://127.0.0.1:{server.server_address[1]}{parts.path}"
+            if parts.query:
+                url += "?" + parts.query
+        return url
+
+    original = requests.Session.request
+
+    def request(session, method, url, *args, **kwargs):
+        return original(session, method, redirect(url), *args, **kwargs)
+
+    requests.Session.request = request
+    if aiohttp is not None:
+        original_async = aiohttp.ClientSession._request
+
+        def async_request(session, method, url, *args, **kwargs):
+            return original_async(session, method, yarl.URL(redirect(str(url)), encoded=True), *args, **kwargs)
+
+        aiohttp.ClientSession._request = async_request
+    try:
+        yield counter
+    finally:
+        requests.Session.request = original
+        if aiohttp is not None:
+            aiohttp.ClientSession._request = original_async
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,176 @@
+"""
+On-disk http response cache.
+
+Responses are stored under the sha256 of the prepared request (method, url
+with params, body) with a small json file of metadata next to them. Every
+source has its own time to live, stale entries are revalidated with
+ETag/Last-Modified, the least recently used entries are evicted once the
+cache grows past max_bytes, and offline mode serves from the cache only.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+import requests
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# (url pattern, seconds to live), first match wins
+TTLS = [
+    (r'changereporttypeajax|changesummaryreporttypeajax', 7 * DAY),  # statements change quarterly
+    (r'investing\.com/search/|algolia\.net|cmservlet\.jsp|quoteservlet\.jsp|Eurofin/autocomplete', 30 * DAY),  # identifiers
+    (r'infrontanalytics\.com', 7 * DAY),
+    (r'i3investor\.com/servlets/stk/fin', DAY),
+    (r'simplywall\.st', DAY),
+    (r'investing\.com/equities/.*-ratios', DAY),
+    (r'investing\.com/equities/', HOUR),  # overview carries the last price
+]
+
+
+class CacheMiss(Exception):
+    """request not in the cache while offline"""
+
+
+class HttpCache:
+    def __init__(self, path='.cache/http', ttls=None, default_ttl=DAY, max_bytes=512 * 1024 * 1024, offline=False):
+        self.path = path
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (TTLS if ttls is None else ttls)]
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.size = None  # bytes on disk, counted on first write
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(method, url, params=None, data=None):
+        request = requests.Request(method, url, params=params, data=data).prepare()
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode()
+        return hashlib.sha256(method.encode() + b' ' + request.url.encode() + b'\n' + body).hexdigest()
+
+    def ttl(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def files(self, key):
+        folder = os.path.join(self.path, key[:2])
+        return os.path.join(folder, key), os.path.join(folder, key + '.json')
+
+    def get(self, key):
+        """(meta, body) of a cached response or None"""
+
+        body_file, meta_file = self.files(key)
+        try:
+            with open(meta_file) as f:
+                meta = json.load(f)
+            with open(body_file, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(body_file)  # mark as recently used
+        except OSError:
+            pass  # evicted since it was read, which doesn't change what was read
+        return meta, body
+
+    def fresh(self, meta):
+        return time.time() - meta['fetched'] < self.ttl(meta['url'])
+
+    def put(self, key, url, response):
+        """store a 200 response to a request for url"""
+
+        body_file, meta_file = self.files(key)
+        os.makedirs(os.path.dirname(body_file), exist_ok=True)
+        meta = {
+            'url': url,
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'encoding': response.encoding,
+            'fetched': time.time(),
+        }
+        self.write(body_file, response.content)
+        self.write(meta_file, json.dumps(meta).encode())
+        with self.lock:
+            if self.size is None:
+                self.size = self.disk_usage()
+            else:
+                self.size += len(response.content)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def revalidated(self, key, meta):
+        """a 304 came back, restart the time to live"""
+
+        meta['fetched'] = time.time()
+        _, meta_file = self.files(key)
+        self.write(meta_file, json.dumps(meta).encode())
+
+    @staticmethod
+    def write(path, content):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def entries(self):
+        """(last used, bytes, key) of every cached body"""
+
+        result = []
+        for folder, _, names in os.walk(self.path):
+            for name in names:
+                if name.endswith('.json') or name.endswith('.tmp'):
+                    continue
+                stat = os.stat(os.path.join(folder, name))
+                result.append((stat.st_mtime, stat.st_size, name))
+        return result
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """drop least recently used entries until the cache is back to 90% of max_bytes"""
+
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            for path in self.files(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size -= size
+
+    @staticmethod
+    def validators(meta):
+        """conditional request headers for a stale entry"""
+
+        cached = requests.structures.CaseInsensitiveDict(meta['headers'])
+        headers = {}
+        if cached.get('ETag'):
+            headers['If-None-Match'] = cached['ETag']
+        if cached.get('Last-Modified'):
+            headers['If-Modified-Since'] = cached['Last-Modified']
+        return headers
+
+    @staticmethod
+    def response(meta, body):
+        """rebuild a requests.Response from a cache entry"""
+
+        response = requests.Response()
+        response.url = meta['url']
+        response.status_code = meta['status']
+        response.headers = requests.structures.CaseInsensitiveDict(meta['headers'])
+        response.encoding = meta['encoding']
+        response._content = body
+        response._content_consumed = True
+        response.from_cache = True
+        return response
@@ -0,0 +1,108 @@
+"""
+Discounted cash flow valuation for grids of scenarios.
+
+Operating cash flow grows at the growth rate every year and each year is
+discounted at the discount rate, as in the excel model. npv_per_share
+values every combination of stock x growth rate x discount rate x horizon
+in one broadcasted numpy pass. The discount rate comes from the stock's
+beta through the bands of DISCOUNT_RATES.
+"""
+import numpy as np
+import pandas as pd
+
+from instrument import recorder
+
+# (highest beta of the band, discount rate), betas above the last band get ABOVE
+DISCOUNT_RATES = [
+    (0.8, 0.05),
+    (1.0, 0.06),
+    (1.1, 0.068),
+    (1.2, 0.07),
+    (1.3, 0.079),
+    (1.4, 0.08),
+    (1.5, 0.089),
+]
+ABOVE = 0.09
+
+
+def discount_rate(beta, bands=None, above=None):
+    """discount rate of the band every beta falls in, for a scalar or an array of betas, nan for nan"""
+
+    bounds, rates = (np.array(i) for i in zip(*(DISCOUNT_RATES if bands is None else bands)))
+    beta = np.asarray(beta, dtype=float)
+    rates = np.append(rates, ABOVE if above is None else above)
+    result = np.where(np.isnan(beta), np.nan, rates[np.searchsorted(bounds, beta, side='left')])
+    return float(result) if result.ndim == 0 else result
+
+
+def per_stock(rates, stocks):
+    """(stocks, n) array from n rates shared by every stock or a (stocks, n) array"""
+
+    rates = np.asarray(rates, dtype=float)
+    if rates.ndim == 0:
+        rates = rates[None]
+    if rates.ndim == 1:
+        rates = np.broadcast_to(rates, (stocks, len(rates)))
+    return rates
+
+
+def npv_per_share(cash_flow, shares, growth_rates, discount_rates, horizons=(10,), terminal_growth=None):
+    """
+    present value per share of every scenario, shape (stocks, growth rates, discount rates, horizons)
+
+    cash_flow and shares are scalars or one value per stock, growth_rates and
+    discount_rates are shared by every stock or given per stock as 2-d arrays.
+    With terminal_growth, the cash flow after the horizon is added as a
+    perpetuity growing at that rate; scenarios discounted at no more than
+    terminal_growth are nan, that perpetuity has no finite value. Horizons
+    are whole years, at least 1.
+    """
+    cash_flow = np.atleast_1d(np.asarray(cash_flow, dtype=float))
+    shares = np.atleast_1d(np.asarray(shares, dtype=float))
+    stocks = len(cash_flow)
+    g = per_stock(growth_rates, stocks)[:, :, None, None]
+    r = per_stock(discount_rates, stocks)[:, None, :, None]
+    horizons = np.atleast_1d(np.asarray(horizons, dtype=int))
+    if horizons.size == 0 or (horizons < 1).any():
+        raise ValueError(f"horizons are at least 1 year, got {horizons.tolist()}")
+    years = np.arange(1, horizons.max() + 1)
+
+    cf = cash_flow[:, None, None, None]
+    discounted = cf * (1 + g) ** years / (1 + r) ** years
+    pv = discounted.cumsum(axis=-1)[..., horizons - 1]
+
+    if terminal_growth is not None:
+        final = cf * (1 + g) ** horizons
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terminal = final * (1 + terminal_growth) / (r - terminal_growth) / (1 + r) ** horizons
+        pv = np.where(r > terminal_growth, pv + terminal, np.nan)
+
+    return pv / shares[:, None, None, None]
+
+
+def sensitivity(cash_flow, shares, growth_rates, discount_rates, horizon=10, terminal_growth=None):
+    """npv per share of one stock, growth rates down the rows and discount rates across"""
+
+    with recorder.stage('dcf', source='sensitivity'):
+        npv = npv_per_share(cash_flow, shares, growth_rates, discount_rates, [horizon], terminal_growth)
+    return pd.DataFrame(npv[0, :, :, 0],
+                        index=pd.Index(np.round(growth_rates, 4), name="Growth Rate"),
+                        columns=pd.Index(np.round(discount_rates, 4), name="Discount Rate"))
+
+
+def inputs(my_stock):
+    """operating cash flow and shares outstanding (millions) of a Stock"""
+
+    operating_cf = my_stock.line_items("cash_flow").search("Cash From Operating Activities")
+    shares_outstanding = my_stock.line_items("overview").search("Shares Outstanding") / 1000000
+    return operating_cf, shares_outstanding
+
+
+def valuation(my_stock):
+    """npv per share over 10 years at the stock's growth and discount rate, and its last price"""
+
+    operating_cf, shares_outstanding = inputs(my_stock)
+    with recorder.stage('dcf', source='valuation'):
+        npv = float(npv_per_share(operating_cf, shares_outstanding, my_stock.growth_rate, my_stock.discount_rate)[0, 0, 0, 0])
+    last_price = my_stock.line_items("overview").search("Last Price")
+    return npv, last_price
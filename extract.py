@@ -0,0 +1,140 @@
+"""
+Declarative extraction of known fragments from large pages.
+
+A Spec lists the Fields to pull from a page. Regex fields are matched on the
+raw text and can be read from a stream that stops as soon as every one of
+them has matched. Element fields are found by tag and attributes in a tree
+built only from the matching tags (SoupStrainer), so the rest of the page
+is never parsed.
+
+A field that isn't on the page, or whose text its type can't read, raises
+ValueError unless it was declared required=False; many fields are [] then.
+"""
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from instrument import recorder
+from lineitems import number
+
+try:
+    import lxml
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+
+class Field:
+    def __init__(self, name, tag=None, attrs=None, pattern=None, attr=None, html=False, many=False, type=str,
+                 required=None):
+        self.name = name
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.pattern = re.compile(pattern) if pattern else None  # first group is the value
+        self.attr = attr  # return this attribute of the element instead of its text
+        self.html = html  # return the element's markup, e.g. for pd.read_html
+        self.many = many  # list of every non-empty match instead of the first one
+        self.type = type
+        self.required = not many if required is None else required  # raise when the page doesn't have it
+
+    def convert(self, text):
+        value = self.type(text)
+        if value is None and self.required:
+            raise ValueError(f"field {self.name!r} can't be read from {text!r}")
+        return value
+
+    def missing(self):
+        """value of a field the page doesn't have"""
+
+        if self.required:
+            raise ValueError(f"field {self.name!r} not found on the page")
+        return [] if self.many else None
+
+    def value(self, element):
+        if self.html:
+            return str(element)
+        if self.attr:
+            return self.convert(element[self.attr])
+        return self.convert(element.get_text())
+
+
+class Spec:
+    def __init__(self, *fields):
+        self.fields = fields
+        self.regexes = [f for f in fields if f.pattern]
+        self.elements = [f for f in fields if not f.pattern]
+
+    def strainer(self):
+        """parse only the tags any element field asks for"""
+
+        tags = sorted({f.tag for f in self.elements})
+        keys = {tuple(f.attrs) for f in self.elements}
+        # class is matched against the raw attribute before it is split into classes, so strain on the tag alone
+        if len(tags) == 1 and len(keys) == 1 and len(next(iter(keys))) == 1 and next(iter(keys))[0] != 'class':
+            key = next(iter(keys))[0]
+            return SoupStrainer(tags[0], {key: [f.attrs[key] for f in self.elements]})
+        return SoupStrainer(tags)
+
+    def match(self, field, text):
+        if field.many:
+            return [field.type(m) for m in field.pattern.findall(text)]
+        m = field.pattern.search(text)
+        return field.convert(m.group(1)) if m else field.missing()
+
+    def extract(self, html, parser=PARSER):
+        """dict of field name -> value, ValueError for a required field that isn't found"""
+
+        with recorder.stage('parse'):
+            return self.parse(html, parser)
+
+    def parse(self, html, parser):
+        result = {f.name: self.match(f, html) for f in self.regexes}
+        if self.elements:
+            soup = BeautifulSoup(html, parser, parse_only=self.strainer())
+            for f in self.elements:
+                if f.many:
+                    values = [f.value(i) for i in soup.find_all(f.tag, f.attrs)]
+                    result[f.name] = [i for i in values if i != '']
+                else:
+                    element = soup.find(f.tag, f.attrs)
+                    result[f.name] = f.missing() if element is None else f.value(element)
+            soup.decompose()
+        return result
+
+    def extract_chunks(self, chunks, overlap=256, check=None, head=32 * 1024):
+        """
+        regex fields from a stream of text chunks, stops reading once all have matched.
+        check(start, whole) gets the first head characters read (whole when that was
+        the entire page) before anything is returned, and raises to reject the page
+        """
+        result = {}
+        tail = ''
+        start = ''
+        whole = True
+        for chunk in chunks:
+            if len(start) < head:
+                start += chunk[:head - len(start)]
+            text = tail + chunk
+            if self.search_chunk(result, text):
+                whole = False
+                break
+            tail = text[-overlap:]
+        if check is not None:
+            check(start, whole and len(start) < head)
+        return self.complete(result)
+
+    def search_chunk(self, result, text):
+        """add the regex fields not matched yet that match in text to result, True once all have"""
+
+        for f in self.regexes:
+            if f.name not in result:
+                m = f.pattern.search(text)
+                if m:
+                    result[f.name] = f.convert(m.group(1))
+        return len(result) == len(self.regexes)
+
+    def complete(self, result):
+        for f in self.regexes:
+            if f.name not in result:
+                result[f.name] = f.missing()
+        return result
@@ -0,0 +1,265 @@
+"""
+Daily prices and earnings of every stock in append-only memory-mapped files.
+
+Prices come from investing.com's historical data table, a year per request,
+and earnings from the earnings page and the morehistory pages behind its
+"Show more". An update asks only for what is newer than the last stored row
+and appends it to a flat file of fixed size records (PRICES, EARNINGS),
+which np.memmap reads back without loading years of rows into memory:
+
+    history = History()
+    transport.run(history.update(stock.stock_cd, stock.stock_id))
+    transport.run(history.update_prices(*MARKET))
+    beta(history.prices(stock.stock_cd), history.prices(MARKET[0]))
+
+Like the scrapers, the update methods are generators of transport.Fetch.
+rolling_beta works on the returns of every stock at once, a (days, stocks)
+matrix from align, so the betas of a whole watchlist are one numpy pass:
+
+    history.betas(['airasia-bhd', 'nestle-malaysia'])
+"""
+import os
+import re
+import datetime
+
+import numpy as np
+
+from extract import number
+from transport import Fetch
+
+PRICES = np.dtype([('date', 'M8[D]'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'), ('volume', 'f8')])
+EARNINGS = np.dtype([('date', 'M8[D]'), ('eps', 'f8'), ('eps_forecast', 'f8'),
+                     ('revenue', 'f8'), ('revenue_forecast', 'f8')])
+
+MARKET = ('klci', '29078')  # name and investing.com pair id of the FTSE Bursa Malaysia KLCI
+
+HISTORICAL = 'https://www.investing.com/instruments/HistoricalDataAjax'
+MOREHISTORY = 'https://www.investing.com/equities/morehistory'
+AJAX = {'User-Agent': 'Mozilla/5.0', 'X-Requested-With': 'XMLHttpRequest'}
+
+ROW = re.compile(r'<tr\b.*?</tr>', re.S)
+REAL_VALUE = re.compile(r'data-real-value="([^"]*)"')
+EARNING = re.compile(r'<tr[^>]*event_timestamp="([\d-]+)[^"]*"[^>]*>(.*?)</tr>', re.S)
+CELL = re.compile(r'<td[^>]*>(.*?)</td>', re.S)
+SUFFIXES = {'K': 1e3, 'M': 1e6, 'B': 1e9, 'T': 1e12}
+
+
+def scale(text):
+    """'1.23B' -> 1.23e9, '/&nbsp;&nbsp;0.03' -> 0.03, '--' -> nan"""
+
+    text = re.sub(r'<[^>]+>|&nbsp;|/', '', text).strip()
+    multiplier = SUFFIXES.get(text[-1:].upper())
+    value = number(text[:-1] if multiplier else text)
+    return np.nan if value is None else value * (multiplier or 1)
+
+
+def parse_prices(html):
+    """PRICES records of an investing.com historical data table"""
+
+    records = []
+    for row in ROW.findall(html):
+        values = REAL_VALUE.findall(row)
+        if len(values) < 6:
+            continue  # header
+        close, open_, high, low, volume = (number(i) for i in values[1:6])
+        date = np.datetime64(int(float(values[0])), 's').astype('M8[D]')
+        records.append((date, open_, high, low, close, np.nan if volume is None else volume))
+    return np.array(records, dtype=PRICES)
+
+
+def parse_earnings(html):
+    """EARNINGS records of the rows of an investing.com earnings table"""
+
+    records = []
+    for timestamp, row in EARNING.findall(html):
+        cells = CELL.findall(row)
+        records.append((np.datetime64(timestamp, 'D'), *(scale(i) for i in cells[2:6])))
+    return np.array(records, dtype=EARNINGS)
+
+
+class Series:
+    """append-only file of records of one dtype sorted by date, read as a memmap"""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // self.dtype.itemsize
+        except OSError:
+            return 0
+
+    def read(self):
+        rows = len(self)
+        if not rows:
+            return np.zeros(0, self.dtype)
+        return np.memmap(self.path, self.dtype, mode='r', shape=(rows,))
+
+    def last(self):
+        """date of the newest record, None when empty"""
+
+        rows = self.read()
+        return rows['date'][-1] if len(rows) else None
+
+    def append(self, records):
+        """append the records newer than the last one, in date order, number appended"""
+
+        _, first = np.unique(records['date'], return_index=True)
+        records = records[first]
+        last = self.last()
+        if last is not None:
+            records = records[records['date'] > last]
+        if not len(records):
+            return 0
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.truncate(len(self) * self.dtype.itemsize)  # drop a record cut short by a crash
+            f.write(records.tobytes())
+        return len(records)
+
+
+class History:
+    def __init__(self, path='timeseries', years=10):
+        self.path = path
+        self.years = years  # how far back the first update of a stock goes
+
+    def series(self, name, kind):
+        dtype = {'prices': PRICES, 'earnings': EARNINGS}[kind]
+        return Series(os.path.join(self.path, f"{name}.{kind}"), dtype)
+
+    def prices(self, name):
+        return self.series(name, 'prices').read()
+
+    def earnings(self, name):
+        return self.series(name, 'earnings').read()
+
+    def update_prices(self, name, pair_id, end=None):
+        """fetch the daily prices after the last stored day, a year per request, number of new days"""
+
+        series = self.series(name, 'prices')
+        end = np.datetime64(end or datetime.date.today(), 'D')
+        last = series.last()
+        start = last + 1 if last is not None else end - 365 * self.years
+        new = 0
+        while start <= end:
+            stop = min(end, start + 365)
+            data = {
+                'curr_id': pair_id,
+                'st_date': start.astype(datetime.date).strftime('%m/%d/%Y'),
+                'end_date': stop.astype(datetime.date).strftime('%m/%d/%Y'),
+                'interval_sec': 'Daily',
+                'sort_col': 'date',
+                'sort_ord': 'DESC',
+                'action': 'historical_data',
+            }
+            response = yield Fetch('POST', HISTORICAL, headers=AJAX, data=data)
+            new += series.append(parse_prices(response.text))
+            start = stop + 1
+        return new
+
+    def update_earnings(self, stock_cd, pair_id):
+        """fetch the earnings releases after the last stored one, paging back only as far as needed"""
+
+        series = self.series(stock_cd, 'earnings')
+        last = series.last()
+        url = f"https://www.investing.com/equities/{stock_cd}-earnings"
+        response = yield Fetch('GET', url, headers={'User-Agent': 'Mozilla/5.0'})
+        pages = [parse_earnings(response.text)]
+        while len(pages[-1]) and (last is None or pages[-1]['date'].min() > last):
+            data = {'pairID': pair_id, 'last_timestamp': str(pages[-1]['date'].min())}
+            response = yield Fetch('POST', MOREHISTORY, headers={**AJAX, 'Referer': url}, data=data)
+            page = response.json()
+            rows = parse_earnings(page['historyRows'])
+            if not len(rows) or rows['date'].min() >= pages[-1]['date'].min():
+                break
+            pages.append(rows)
+            if str(page.get('hasMoreHistory')) != '1':
+                break
+        return series.append(np.concatenate(pages))
+
+    def betas(self, names, window=252, market=MARKET[0]):
+        """latest rolling beta of every named stock against the market, nan without enough history"""
+
+        dates, stock_returns, market_returns = align([self.prices(name) for name in names], self.prices(market))
+        if not len(dates):
+            return np.full(len(names), np.nan)
+        return rolling_beta(stock_returns, market_returns, window)[-1]
+
+    def update(self, stock_cd, pair_id):
+        """update prices and earnings of a stock, (new days, new releases)"""
+
+        prices = yield from self.update_prices(stock_cd, pair_id)
+        earnings = yield from self.update_earnings(stock_cd, pair_id)
+        return prices, earnings
+
+
+def returns(prices):
+    """daily simple returns of the close"""
+
+    close = np.asarray(prices['close'])
+    return close[1:] / close[:-1] - 1
+
+
+def volatility(prices, periods=252):
+    """annualised standard deviation of the daily log returns"""
+
+    return float(np.diff(np.log(prices['close'])).std(ddof=1) * np.sqrt(periods))
+
+
+def beta(prices, market):
+    """beta of a stock's daily returns against the market's, on the days both traded"""
+
+    _, i, j = np.intersect1d(prices['date'], market['date'], return_indices=True)
+    stock_returns = returns(prices[i])
+    market_returns = returns(market[j])
+    covariance = np.cov(stock_returns, market_returns)
+    return float(covariance[0, 1] / covariance[1, 1])
+
+
+def align(prices, market):
+    """
+    (dates, stock returns, market returns) on the market's trading days
+
+    prices is a list of PRICES records, one per stock, the stock returns are
+    a (days, stocks) matrix with nan where a stock didn't trade that day or
+    the day before
+    """
+    dates = np.asarray(market['date'])
+    closes = np.full((len(dates), len(prices)), np.nan)
+    for column, records in enumerate(prices):
+        rows = np.searchsorted(dates, records['date'])
+        found = rows < len(dates)
+        found[found] = dates[rows[found]] == records['date'][found]
+        closes[rows[found], column] = records['close'][found]
+    market_close = np.asarray(market['close'], dtype=float)
+    return dates[1:], closes[1:] / closes[:-1] - 1, market_close[1:] / market_close[:-1] - 1
+
+
+def rolling_beta(stock_returns, market_returns, window=252, min_periods=None):
+    """
+    beta of every stock on every day over the trailing window of days, shape of stock_returns
+
+    Every stock uses only the days it has returns for within the window, nan
+    below min_periods of them (half the window by default). The windowed sums
+    come from cumulative sums, so the cost doesn't grow with the window.
+    """
+    if min_periods is None:
+        min_periods = window // 2
+    y = np.asarray(stock_returns, dtype=float)
+    x = np.asarray(market_returns, dtype=float)[:, None]
+    traded = ~np.isnan(y) & ~np.isnan(x)
+    x = np.where(traded, x, 0)
+    y = np.where(traded, y, 0)
+
+    def windowed(values):
+        total = np.cumsum(values, axis=0)
+        total[window:] = total[window:] - total[:-window]
+        return total
+
+    n = windowed(traded.astype(float))
+    sx, sy, sxx, sxy = windowed(x), windowed(y), windowed(x * x), windowed(x * y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+    beta[n < min_periods] = np.nan
+    return beta
@@ -0,0 +1,189 @@
+"""
+Stage timings and memory of the scrape/analyse pipeline.
+
+recorder.stage() times a block and records it with the stock and source it
+ran for (taken from context variables that Stock.fetch and analyse set),
+plus whatever the block adds to the record, such as bytes, status and
+retries of a fetch. Recording is off until recorder.enabled is set.
+write() saves p50/p95 per stage and source as json or csv.
+
+Memory samples the resident size of the process in a background thread and
+keeps the peak seen while each stock is analysed. With a budget, admit()
+holds a stock back until the process is under it again.
+"""
+import gc
+import os
+import csv
+import math
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+current_stock = contextvars.ContextVar('current_stock', default=None)
+current_source = contextvars.ContextVar('current_source', default=None)
+
+
+def percentile(values, q):
+    """nearest rank percentile of sorted values"""
+
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+class Recorder:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage, source=None, **fields):
+        """time the block as stage, yields the record so the block can add to it"""
+
+        if not self.enabled:
+            yield {}
+            return
+        record = {'stock': current_stock.get(), 'stage': stage, 'source': source or current_source.get(), **fields}
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            with self.lock:
+                self.records.append(record)
+
+    def summary(self):
+        """one row per stage, source and host with count, p50, p95, max, bytes and retries"""
+
+        groups = {}
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            key = (record['stage'], record['source'] or '', record.get('host') or '')
+            groups.setdefault(key, []).append(record)
+        rows = []
+        for (stage, source, host), group in sorted(groups.items()):
+            seconds = sorted(i['seconds'] for i in group)
+            rows.append({
+                'stage': stage,
+                'source': source,
+                'host': host,
+                'count': len(group),
+                'errors': sum(1 for i in group if 'error' in i),
+                'total': sum(seconds),
+                'p50': percentile(seconds, 50),
+                'p95': percentile(seconds, 95),
+                'max': seconds[-1],
+                'bytes': sum(i.get('bytes') or 0 for i in group),
+                'retries': sum(i.get('retries') or 0 for i in group),
+                'cached': sum(1 for i in group if i.get('cached')),
+                'statuses': ' '.join(f"{status}x{n}" for status, n in sorted(
+                    {i['status']: sum(1 for j in group if j.get('status') == i['status'])
+                     for i in group if i.get('status')}.items())),
+            })
+        return rows
+
+    def write(self, path):
+        """run report, json with every record or csv of the summary"""
+
+        rows = self.summary()
+        if path.endswith('.json'):
+            with self.lock:
+                records = list(self.records)
+            with open(path, 'w') as f:
+                json.dump({'summary': rows, 'records': records}, f, indent=1, default=str)
+            return
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, list(rows[0]) if rows else ['stage'])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def print_summary(self):
+        print(f"{'stage':<8} {'source':<14} {'host':<28} {'n':>5} {'p50':>8} {'p95':>8} {'total':>8} {'MB':>7}")
+        for row in self.summary():
+            print(f"{row['stage']:<8} {row['source']:<14} {row['host']:<28} {row['count']:>5} "
+                  f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['total']:>8.2f} {row['bytes'] / 1e6:>7.2f}")
+
+
+def rss():
+    """resident set size of the process in bytes (the peak so far where only that is known), None if unknown"""
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class Memory:
+    """
+    peak resident size while each stock is analysed, sampled every interval seconds
+
+    The process is shared, so with stocks analysed in parallel a stock's peak
+    is the process's while it ran; with one worker it is the stock's own.
+    """
+    def __init__(self, budget=None, interval=0.01):
+        self.budget = budget  # bytes, None for no limit
+        self.interval = interval
+        self.peaks = {}  # stock being analysed -> peak so far
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.sample, daemon=True, name="memory")
+                self.thread.start()
+
+    def sample(self):
+        while True:
+            size = rss() or 0
+            with self.lock:
+                for stock, peak in self.peaks.items():
+                    self.peaks[stock] = max(peak, size)
+            time.sleep(self.interval)
+
+    @contextmanager
+    def track(self, stock):
+        """yields a dict that gets the 'peak' bytes of the block when it ends"""
+
+        self.start()
+        usage = {}
+        with self.lock:
+            self.peaks[stock] = rss() or 0
+        try:
+            yield usage
+        finally:
+            with self.lock:
+                usage['peak'] = max(self.peaks.pop(stock), rss() or 0)
+
+    def admit(self):
+        """wait until the process is under budget, or no other stock is running to free anything"""
+
+        while self.budget:
+            size = rss()
+            if size is None or size <= self.budget:
+                return
+            gc.collect()
+            with self.lock:
+                if not self.peaks:
+                    return
+            time.sleep(self.interval * 10)
+
+
+recorder = Recorder()
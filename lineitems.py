@@ -0,0 +1,83 @@
+"""
+Line items of a scraped statement, parsed once for repeated lookups.
+
+A statement is a df with the line item names in column 0 and values in the
+other columns. LineItems parses one value column to numbers up front and
+answers exact, prefix and regex lookups, remembering every search so a term
+looked up again is a dict hit.
+"""
+import re
+import bisect
+
+
+def number(text):
+    """'1,234.5' -> 1234.5, '12.4%' -> 0.124, anything else -> None"""
+
+    text = str(text).strip().replace(',', '')
+    percent = text.endswith('%')
+    try:
+        value = float(text.rstrip('%'))
+    except ValueError:
+        return None
+    return value / 100 if percent else value
+
+
+def value(cell):
+    """number of a cell, or the cell as a string when it isn't one"""
+
+    result = number(cell)
+    return str(cell) if result is None else result
+
+
+def normalize(name):
+    return " ".join(str(name).lower().split())
+
+
+class LineItems:
+    def __init__(self, df, column=1):
+        self.labels = [str(i) for i in df[0]]
+        self.values = [value(i) for i in df[column]]
+        self.positions = {}  # normalized name -> first row with it
+        for position, label in enumerate(self.labels):
+            self.positions.setdefault(normalize(label), position)
+        self.names = sorted(self.positions)
+        self.searches = {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def exact(self, name):
+        """value of the line item called name, ignoring case and spacing"""
+
+        return self.values[self.positions[normalize(name)]]
+
+    def prefix(self, prefix):
+        """{name: value} of the line items starting with prefix"""
+
+        prefix = normalize(prefix)
+        start = bisect.bisect_left(self.names, prefix)
+        result = {}
+        for name in self.names[start:]:
+            if not name.startswith(prefix):
+                break
+            result[name] = self.values[self.positions[name]]
+        return result
+
+    def regex(self, pattern):
+        """{label: value} of the line items matching pattern anywhere, ignoring case"""
+
+        pattern = re.compile(pattern, re.IGNORECASE)
+        return {label: self.values[i] for i, label in enumerate(self.labels) if pattern.search(label)}
+
+    def search(self, term):
+        """value of the first line item matching term anywhere, like scrape.search"""
+
+        if term not in self.searches:
+            pattern = re.compile(term, re.IGNORECASE)
+            for i, label in enumerate(self.labels):
+                if pattern.search(label):
+                    self.searches[term] = self.values[i]
+                    break
+            else:
+                raise KeyError(term)
+        return self.searches[term]
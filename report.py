@@ -0,0 +1,387 @@
+"""
+Excel reports of analysed stocks.
+
+write_stock lays out the valuation sheet of one stock. Cells go into a
+Sheet buffer and are written out in row order, so the same layout works
+for xlsxwriter's constant_memory mode, where a row can no longer be
+changed once a later row is written. write_workbook makes the workbook of
+a single stock; ReportWriter streams many stocks into one workbook, one
+sheet each plus a summary sheet, with the cell formats created once.
+"""
+import datetime
+import threading
+
+import numpy as np
+import xlsxwriter
+from xlsxwriter.utility import xl_cell_to_rowcol
+
+import dcf
+from instrument import recorder
+
+now = datetime.datetime.now()
+
+# colours
+blue = '#98C4D1'
+yellow = '#FEC240'
+red = '#DE4B43'
+
+FORMATS = {
+    'title': {
+        'bold': True,
+        'font_color': blue,
+        'font_size': 16
+        },
+    'currency': {
+        'num_format': '$#,##0.00',
+        'border': 1
+        },
+    'percentage': {
+        'num_format': '0.0%',
+        'bg_color': blue,
+        'border': 1
+        },
+    'colored': {
+        'bg_color': blue,
+        'border': 1
+        },
+    'colored_currency': {
+        'num_format': '$#,##0.00',
+        'bg_color': blue,
+        'border': 1
+        },
+    'border': {
+        'border': 1
+        },
+}
+
+# bump whenever the sheets change, so reports of stocks whose data didn't change are written again
+TEMPLATE_VERSION = 2
+
+# sensitivity table: growth rate offsets from the stock's own and discount rates
+growth_offsets = np.linspace(-0.05, 0.05, 11)
+discount_rates = np.linspace(0.05, 0.12, 8)
+
+
+def add_formats(workbook):
+    return {name: workbook.add_format(spec) for name, spec in FORMATS.items()}
+
+
+class Sheet:
+    """worksheet stand-in that keeps cells until flush writes them in row order"""
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.cells = {}
+
+    @staticmethod
+    def position(args):
+        if isinstance(args[0], str):
+            row, col = xl_cell_to_rowcol(args[0])
+            return row, col, args[1:]
+        return args[0], args[1], args[2:]
+
+    def put(self, method, args):
+        row, col, args = self.position(args)
+        value, cell_format = (list(args) + [None, None])[:2]
+        self.cells[row, col] = (method, value, cell_format)
+
+    def write(self, *args):
+        self.put('write', args)
+
+    def write_formula(self, *args):
+        self.put('write_formula', args)
+
+    def write_column(self, *args):
+        row, col, (data, *cell_format) = self.position(args)
+        for i, value in enumerate(data):
+            self.cells[row + i, col] = ('write', value, cell_format[0] if cell_format else None)
+
+    def write_row(self, *args):
+        row, col, (data, *cell_format) = self.position(args)
+        for i, value in enumerate(data):
+            self.cells[row, col + i] = ('write', value, cell_format[0] if cell_format else None)
+
+    def set_row(self, *args):
+        self.worksheet.set_row(*args)
+
+    def set_column(self, *args):
+        self.worksheet.set_column(*args)
+
+    def flush(self):
+        for row, col in sorted(self.cells):
+            method, value, cell_format = self.cells[row, col]
+            getattr(self.worksheet, method)(row, col, value, cell_format)
+        self.cells = {}
+
+
+def cell(statement, i, j=0):
+    """cell of a statements.Statement to write, blank where it's empty"""
+
+    value = statement.cell(i, j)
+    return None if value != value else value
+
+
+def write_stock(worksheet, formats, my_stock):
+    """valuation sheet of a stock"""
+
+    title_format = formats['title']
+    currency_format = formats['currency']
+    percentage_format = formats['percentage']
+    colored_format = formats['colored']
+    colored_currency_format = formats['colored_currency']
+    border_format = formats['border']
+
+    # format excel
+    worksheet.set_row(0, 40)
+    worksheet.set_column('A:A', 20)
+    worksheet.set_column('A:I', 10)
+
+
+    # Required data for npv calculation, table 1
+    # --------------------------------------------------------
+    cash_flow_items = my_stock.line_items("cash_flow")
+    balance_sheet_items = my_stock.line_items("balance_sheet")
+    overview_items = my_stock.line_items("overview")
+    ratios_items = my_stock.line_items("ratios")
+
+    table01 = (0, 0)
+    table1 = {
+        "Name of Stock": my_stock.stock_cd.replace("-", " ").title(),
+        "Operating Cash Flow": cash_flow_items.search("Cash From Operating Activities"),
+        "Total Debt": balance_sheet_items.search("Total Long Term Debt"),
+        "Cash & Equivalent": balance_sheet_items.search("Cash & Equivalent"),
+        "Growth Rate": 0,
+        "No. of Shares Outstanding": overview_items.search("Shares Outstanding") / 1000000,
+        "Discount Rate": 0
+    }
+
+    worksheet.write_column('A1', table1.keys(), border_format)
+    worksheet.write_column('B1', table1.values(), colored_currency_format)
+
+    # rewrite in title and percentage format
+    worksheet.write('B1', my_stock.stock_cd.replace("-", " ").title(), title_format)
+    worksheet.write('B5', my_stock.growth_rate, percentage_format)
+    worksheet.write('B7', my_stock.discount_rate, percentage_format)
+
+
+    # Ten-year cash flow calculations, bottom table
+    # --------------------------------------------------------
+    table11 = (11, 0)
+    calc_row = table11[0]
+
+    # headers
+    worksheet.write_column(calc_row, 0, ["Year", "Cash Flow", "Discount Rate", "Discounted Value"], border_format)
+    worksheet.write_row(calc_row, 1, list(range(now.year, now.year + 10, 1)), border_format)
+
+    # calculation formulas
+    cash_flow = ["=B2*(1+B5)"]
+    cash_flow.extend(["=" + chr(ord('B') + i) + str(calc_row+2) + "*(1+$B$5)" for i in range(10)])
+    # +1, +2
+    cf_row = calc_row + 1
+    for i in range(10):
+        worksheet.write_formula(cf_row, i+1, cash_flow[i], currency_format)
+        
+    # +2, +3
+    dr_row = calc_row + 2
+    discount_rate = ["=1/(1 + $B$7)^" + str(i) for i in range(1, 11)]
+    for i in range(10):
+        worksheet.write_formula(dr_row, i+1, discount_rate[i], border_format)
+
+    # +3, +4
+    dv_row = calc_row + 3
+    discounted_value = ["=PRODUCT("+chr(ord('B')+i)+str(cf_row+1)+":"+chr(ord('B')+i)+str(dr_row+1)+")" for i in range(10)]
+    for i in range(10):
+        worksheet.write_formula(dv_row, i+1, discounted_value[i], currency_format)
+
+
+    # NPV and intrinsic values calculations, table 2
+    # --------------------------------------------------------
+    # table02 = ()
+    worksheet.write_column('D2', ["PV of 10 yr Cash Flows", "Intrinsic Value per Share", 
+                                  "- Debt per Share", "+ Cash per share", "net Cash per Share"], border_format)
+    worksheet.write_column('E2', [f"=SUM(B{dv_row+1}:K{dv_row+1})", "=E2/B6", "=B3/B6", "=B4/B6", "=E3-E4+E5"], colored_currency_format)
+
+
+    # Stock overview, table 3
+    # --------------------------------------------------------
+    # table03 = ()
+    overview = my_stock.overview
+    index = [0, 5, 6, 7, 8, 9, 11, 15]
+    worksheet.write_column('G2', [overview.labels[i] for i in index], border_format)
+    worksheet.write_column('H2', [cell(overview, i) for i in index], colored_format)
+
+
+    # Jot down links from simply wall st and infront analytics
+    # --------------------------------------------------------
+    row = table11[0] + 5
+    worksheet.write_column(row, 0, my_stock.urls)
+
+
+    # Overview by i3investor
+    # --------------------------------------------------------
+    i3summary = my_stock.i3summary
+    i3business_performance = my_stock.i3business_performance
+
+    # i3investor table, table 4
+    # table04 = ()
+    i3summary_column = 9
+    worksheet.set_column(i3summary_column, i3summary_column+1, 20)  # Width of column B set to 30.
+
+    worksheet.write_column(1, i3summary_column, i3summary.labels, border_format)
+    worksheet.write_column(1, i3summary_column+1, [cell(i3summary, i) for i in range(len(i3summary))],
+                           colored_currency_format)
+
+    # summary tables
+    start_row = 23
+    start_column = 0
+
+    for key in i3business_performance:
+        worksheet.write(start_row, start_column, key)
+        
+        cur_df = i3business_performance[key]
+        for col in cur_df.columns:
+            cur_col = []
+            cur_col.append(col.replace("Unnamed: 0", ""))
+            cur_col.extend(cur_df[col])
+            worksheet.write_column(start_row+1, start_column, cur_col, border_format)
+            start_column += 1
+        start_column += 1
+
+
+    # Ratios by investing, table 5
+    # --------------------------------------------------------
+    # table05
+    start_row = 1
+    start_column = 12
+    ratios = my_stock.ratios
+    ratios_header = range(6)
+    worksheet.write_column(start_row, start_column, [''] + [ratios.labels[i] for i in ratios_header], border_format)
+    for j, col in enumerate(ratios.columns):
+        start_column += 1
+        cur_col = [col] + [cell(ratios, i, j) for i in ratios_header]
+        worksheet.write_column(start_row, start_column, cur_col, border_format)
+
+    total_assets = balance_sheet_items.search("Total Assets")
+    total_liabilities = balance_sheet_items.search("Total Liabilities")
+    current_shares_outstanding = balance_sheet_items.search("Total Common Shares Outstanding")
+    total_equity = balance_sheet_items.search("Total Equity")
+
+    net_assets = total_assets - total_liabilities
+    net_asset_value = net_assets / current_shares_outstanding
+    net_asset_value = round(net_asset_value, 2)
+
+    table5 = {
+        "EPS": ratios_items.search("Basic EPS ANN"),
+        "EPS(MRQ) vs Qtr. 1 Yr. Ago MRQ": ratios_items.search("EPS\(MRQ\) vs Qtr. 1 Yr. Ago MRQ"),
+        "EPS(TTM) vs TTM 1 Yr. Ago TTM": ratios_items.search("EPS\(TTM\) vs TTM 1 Yr. Ago TTM"),
+        "5 Year EPS Growth 5YA": ratios_items.search("5 Year EPS Growth 5YA"),
+            
+        "Return on Equity TTM": ratios_items.search("Return on Equity TTM"),
+        "Return on Equity 5YA": ratios_items.search("Return on Equity 5YA"),
+            
+        "Price to Earnings Ratio": ratios_items.search("P/E Ratio TTM"),
+            
+        "Dividend per Share": ratios_items.search("Dividend Yield ANN"),
+        "Dividend Yield 5 Year Avg. 5YA": ratios_items.search("Dividend Yield 5 Year Avg. 5YA"),
+        "Dividend Growth Rate ANN": ratios_items.search("Dividend Growth Rate ANN"),
+            
+        "Net Asset per Share": net_asset_value,
+        "Price to Book": ratios_items.search("Price to Book MRQ"),
+        "LT Debt to Equity": ratios_items.search("LT Debt to Equity")
+    }
+
+    # Continuation, table 5
+    start_row = len(ratios_header) + 2
+    start_column = 12
+    worksheet.write_column(start_row, start_column, table5.keys(), border_format)
+    worksheet.write_column(start_row, start_column+1, table5.values(), colored_format)
+
+
+def write_sensitivity(worksheet, formats, my_stock, row=0, col=0):
+    """npv per share for a grid of growth and discount rates"""
+
+    operating_cf, shares_outstanding = dcf.inputs(my_stock)
+    sensitivity = dcf.sensitivity(operating_cf, shares_outstanding, my_stock.growth_rate + growth_offsets, discount_rates)
+    worksheet.write(row, col, "Growth \\ Discount Rate", formats['border'])
+    worksheet.write_row(row, col + 1, sensitivity.columns, formats['percentage'])
+    worksheet.write_column(row + 1, col, sensitivity.index, formats['percentage'])
+    for i, values in enumerate(sensitivity.values):
+        worksheet.write_row(row + 1 + i, col + 1, values, formats['currency'])
+
+
+def write_workbook(excel_name, my_stock):
+    """workbook of one stock, valuation on Sheet1 and sensitivity on its own sheet"""
+
+    with recorder.stage('excel', source='workbook'):
+        workbook = xlsxwriter.Workbook(excel_name, {'constant_memory': True})
+        formats = add_formats(workbook)
+
+        worksheet = Sheet(workbook.add_worksheet("Sheet1"))
+        write_stock(worksheet, formats, my_stock)
+        worksheet.flush()
+
+        sensitivity_sheet = Sheet(workbook.add_worksheet("Sensitivity"))
+        sensitivity_sheet.set_column(0, 0, 20)
+        write_sensitivity(sensitivity_sheet, formats, my_stock)
+        sensitivity_sheet.flush()
+
+        workbook.close()
+    # Shift + Ctrl + F9
+
+
+class ReportWriter:
+    """one workbook for a batch: a summary sheet and a sheet per stock, written as stocks arrive"""
+
+    sensitivity_row = 40  # below the i3investor tables
+
+    def __init__(self, path):
+        self.path = path
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        self.formats = add_formats(self.workbook)
+        self.summary = self.workbook.add_worksheet("Summary")
+        self.rows = []
+        self.names = set()
+        self.lock = threading.Lock()
+
+    def sheet_name(self, stock_cd):
+        """unique sheet name within excel's 31 characters"""
+
+        name = stock_cd[:31]
+        i = 1
+        while name.lower() in self.names:
+            i += 1
+            name = f"{stock_cd[:31 - len(str(i)) - 1]}-{i}"
+        self.names.add(name.lower())
+        return name
+
+    def add(self, my_stock):
+        """write the sheet of a stock, returns (npv, last price, sheet name)"""
+
+        npv, last_price = dcf.valuation(my_stock)
+        with self.lock, recorder.stage('excel', source='sheet'):
+            name = self.sheet_name(my_stock.stock_cd)
+            worksheet = Sheet(self.workbook.add_worksheet(name))
+            write_stock(worksheet, self.formats, my_stock)
+            write_sensitivity(worksheet, self.formats, my_stock, row=self.sensitivity_row)
+            worksheet.flush()
+            self.rows.append([my_stock.stock_cd, npv, last_price, (npv - last_price) / npv if npv else None,
+                              my_stock.growth_rate, my_stock.discount_rate, name])
+        return npv, last_price, name
+
+    def close(self):
+        """write the summary, most undervalued first, and close the workbook"""
+
+        formats = self.formats
+        self.summary.set_column(0, 0, 30)
+        self.summary.set_column(1, 5, 14)
+        self.summary.write_row(0, 0, ["Stock", "NPV per Share", "Last Price", "Margin of Safety",
+                                      "Growth Rate", "Discount Rate"], formats['title'])
+        rows = sorted(self.rows, key=lambda row: -row[3] if row[3] is not None else float('inf'))
+        for i, (stock_cd, npv, last_price, margin, growth, discount, name) in enumerate(rows, 1):
+            self.summary.write_url(i, 0, f"internal:'{name}'!A1", string=stock_cd)
+            self.summary.write(i, 1, npv, formats['colored_currency'])
+            self.summary.write(i, 2, last_price, formats['currency'])
+            self.summary.write(i, 3, margin, formats['percentage'])
+            self.summary.write(i, 4, growth, formats['percentage'])
+            self.summary.write(i, 5, discount, formats['percentage'])
+        self.workbook.close()
@@ -0,0 +1,272 @@
+"""
+Polite crawling: per-site rates that follow the site's answers, and the
+requests of every ticker interleaved by site.
+
+AdaptiveLimiter is a transport rate limiter with a token bucket per host.
+A host starts at rate requests/s, gains increase for every answer, loses
+half its rate (decrease) on a 429, 503 or block page and rests for the
+Retry-After, and eases off while the site answers slower than slow times
+the fastest it has. It never goes under min_rate or over max_rate.
+
+Scheduler fetches a batch of Stocks on one pool of threads. Every Fetch
+of every ticker goes to its host's queue; a free thread takes the request
+of the host whose next token comes first with fewer than per_host in
+flight, so a site that pushes back holds up only its own queue while the
+other sites are kept busy. Within a host, requests that more sources wait
+for (the investing.com link) go first.
+
+    transport.rate_limiter = AdaptiveLimiter(rate=2)
+    stocks = Scheduler(workers=32).fetch_all(['airasia', 'nestle'])
+"""
+import time
+import heapq
+import types
+import itertools
+import threading
+from urllib.parse import urlsplit
+
+from stock import Stock
+from transport import transport, RateLimiter
+from instrument import current_stock, current_source
+
+THROTTLE_STATUS = {429, 503}
+
+
+class Bucket:
+    def __init__(self, rate, tokens, now):
+        self.rate = rate  # requests per second
+        self.tokens = tokens  # negative when requests are waiting for tokens
+        self.updated = now  # tokens were counted then, in the future while the host rests
+        self.latency = None  # moving average of seconds per answer
+        self.fastest = None
+
+
+class AdaptiveLimiter(RateLimiter):
+    """token bucket per host, its rate raised while the site answers fine and cut when it pushes back"""
+
+    def __init__(self, rate=2.0, rates=None, burst=2, min_rate=0.1, max_rate=None, increase=0.1, decrease=0.5,
+                 slow=3.0):
+        super().__init__(rate, rates)
+        self.burst = burst  # requests a host that rested may get at once
+        self.min_rate = min_rate
+        self.max_rate = max_rate or 10 * rate
+        self.increase = increase  # requests/s more per answer
+        self.decrease = decrease  # rate kept when the site pushes back
+        self.slow = slow
+        self.buckets = {}
+
+    def bucket(self, host, now):
+        """the host's bucket, with the tokens it got since it was last counted"""
+
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = Bucket(self.rates.get(host, self.rate), self.burst, now)
+        if now > bucket.updated:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+        return bucket
+
+    @staticmethod
+    def wait_for(bucket, now, tokens):
+        """seconds until the bucket has tokens"""
+
+        return max(0, bucket.updated - now) + max(0, tokens - bucket.tokens) / bucket.rate
+
+    def reserve(self, url):
+        with self.lock:
+            now = time.monotonic()
+            bucket = self.bucket(urlsplit(url).netloc, now)
+            bucket.tokens -= 1
+            return self.wait_for(bucket, now, 0)
+
+    def ready_in(self, host):
+        with self.lock:
+            now = time.monotonic()
+            return self.wait_for(self.bucket(host, now), now, 1)
+
+    def feedback(self, url, status, seconds, reason=None, retry_after=None):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            bucket = self.bucket(host, now)
+            if reason is not None or status in THROTTLE_STATUS:
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                bucket.tokens = min(bucket.tokens, 0)
+                rest = retry_after if retry_after is not None else 1 / bucket.rate
+                bucket.updated = max(bucket.updated, now + rest)
+                print(f"{host}: {reason or status}, resting {rest:.1f}s at {bucket.rate:.2f} requests/s")
+            elif status is None or status >= 500:
+                bucket.rate = max(self.min_rate, bucket.rate * (1 + self.decrease) / 2)
+            else:
+                bucket.latency = seconds if bucket.latency is None else 0.8 * bucket.latency + 0.2 * seconds
+                bucket.fastest = min(bucket.fastest or bucket.latency, bucket.latency)
+                if bucket.latency > self.slow * bucket.fastest:
+                    bucket.rate = max(self.min_rate, bucket.rate * 0.9)
+                else:
+                    bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def current(self):
+        """{host: requests per second}"""
+
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+
+def waiting_on(sources=Stock.sources):
+    """{source: how many sources wait for it, directly or not}"""
+
+    def dependents(source):
+        direct = {i for i, deps in sources.items() if source in deps}
+        return direct.union(*(dependents(i) for i in direct))
+
+    return {source: len(dependents(source)) for source in sources}
+
+
+class Job:
+    """a source of a stock being scraped, its scraper generator and the Fetch it waits for"""
+
+    def __init__(self, stock, source, steps):
+        self.stock = stock
+        self.source = source
+        self.steps = steps
+
+
+class Scheduler:
+    def __init__(self, sync=transport, workers=32, per_host=4):
+        self.sync = sync
+        self.workers = workers  # threads, and so requests in flight in total
+        self.per_host = per_host  # requests in flight per host
+        self.priority = waiting_on()
+        self.queues = {}  # host -> heap of (-priority, order, job, fetch)
+        self.active = {}  # host -> requests in flight
+        self.served = {}  # host -> when a request was last taken, so hosts that are just as ready take turns
+        self.order = itertools.count()
+        self.pending = {}  # company -> {source: sources it still waits for}
+        self.errors = {}  # company -> exception that stopped it
+        self.busy = 0  # jobs being answered or advanced
+        self.cond = threading.Condition()
+
+    def fetch_all(self, companies, sources=None):
+        """{company: Stock, or the exception that stopped it} of every company"""
+
+        stocks = {company: Stock(company, sources=[]) for company in companies}
+        for company, stock in stocks.items():
+            self.pending[company] = stock.plan(sources)
+            self.release(stock)
+        threads = [threading.Thread(target=self.work, name=f"schedule-{i}") for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {company: self.errors.get(company, stock) for company, stock in stocks.items()}
+
+    def release(self, stock):
+        """start every source of the stock that waits for nothing anymore"""
+
+        with self.cond:
+            pending = self.pending[stock.company]
+            ready = [source for source, deps in pending.items() if not deps]
+            for source in ready:
+                del pending[source]
+        for source in ready:
+            self.start(stock, source)
+
+    def start(self, stock, source):
+        token = current_stock.set(stock.company), current_source.set(source)
+        try:
+            steps = getattr(stock, 'load_' + source)()
+        except Exception as e:
+            return self.fail(stock, e)
+        finally:
+            current_stock.reset(token[0])
+            current_source.reset(token[1])
+        job = Job(stock, source, steps)
+        if isinstance(steps, types.GeneratorType):
+            self.advance(job, None, first=True)
+        else:
+            self.done(job)
+
+    def advance(self, job, answer, first=False):
+        """run the job's scraper up to its next Fetch and queue it, or on to the sources waiting for it"""
+
+        try:
+            fetch = next(job.steps) if first else job.steps.send(answer)
+        except StopIteration:
+            return self.done(job)
+        except Exception as e:
+            return self.fail(job.stock, e)
+        host = urlsplit(fetch.url).netloc
+        with self.cond:
+            entry = (-self.priority.get(job.source, 0), next(self.order), job, fetch)
+            heapq.heappush(self.queues.setdefault(host, []), entry)
+            self.cond.notify()
+
+    def done(self, job):
+        company = job.stock.company
+        with self.cond:
+            if company in self.errors:
+                return
+            for deps in self.pending[company].values():
+                if job.source in deps:
+                    deps.remove(job.source)
+        self.release(job.stock)
+
+    def fail(self, stock, error):
+        print(f"{stock.company}: failed with {error!r}")
+        with self.cond:
+            self.errors.setdefault(stock.company, error)
+            self.pending[stock.company] = {}
+
+    def take(self):
+        """(host, job, fetch) of the host ready soonest, None once every queue is empty and nothing is running"""
+
+        with self.cond:
+            while True:
+                for queue in self.queues.values():
+                    while queue and queue[0][2].stock.company in self.errors:
+                        heapq.heappop(queue)
+                hosts = [host for host, queue in self.queues.items()
+                         if queue and self.active.get(host, 0) < self.per_host]
+                if not hosts:
+                    if self.busy == 0 and not any(self.queues.values()):
+                        self.cond.notify_all()
+                        return None
+                    self.cond.wait()
+                    continue
+                wait, _, host = min((self.sync.rate_limiter.ready_in(host), self.served.get(host, 0), host)
+                                    for host in hosts)
+                if wait > 0:
+                    self.cond.wait(wait)  # stay free for a host that gets ready sooner
+                    continue
+                _, _, job, fetch = heapq.heappop(self.queues[host])
+                self.active[host] = self.active.get(host, 0) + 1
+                self.served[host] = time.monotonic()
+                self.busy += 1
+                return host, job, fetch
+
+    def work(self):
+        while True:
+            task = self.take()
+            if task is None:
+                return
+            host, job, fetch = task
+            token = current_stock.set(job.stock.company), current_source.set(job.source)
+            try:
+                answer = self.sync.answer(fetch)
+            except Exception as e:
+                self.fail(job.stock, e)
+            else:
+                self.advance(job, answer)
+            finally:
+                current_stock.reset(token[0])
+                current_source.reset(token[1])
+                with self.cond:
+                    self.active[host] -= 1
+                    self.busy -= 1
+                    self.cond.notify_all()
+
+
+def fetch_all(companies, workers=32, per_host=4, sync=transport):
+    """{company: Stock, or the exception that stopped it} of every company, requests interleaved by site"""
+
+    return Scheduler(sync, workers, per_host).fetch_all(companies)
@@ -1,272 +1,502 @@
 #!/usr/bin/env python
 # coding: utf-8
-
+"""
+value stocks with a 10 year dcf and write an excel sheet per stock
+
+    scrape.py resolve COMPANY...   identifiers of each company on every site
+    scrape.py fetch COMPANY...     scrape into the store, no reports
+    scrape.py analyse COMPANY...   scrape, value and write the reports (the default)
+    scrape.py report COMPANY...    stored npv against last price, --excel to write the workbooks again
+    scrape.py screen [WHERE]       every stored stock matching an expression, by margin of safety
+    scrape.py revalue              beta, discount rate and npv of every stored stock from the stored prices
+    scrape.py serve COMPANY...     keep stocks in memory and answer http/json, see server.py
+
+Pandas, bs4, requests and xlsxwriter take most of a second to import, so
+they are imported by the commands that need them: resolving a company
+already in the symbol table and printing a stored valuation only read
+sqlite. benchmarks/bench_suite.py times these against STARTUP_BUDGETS.
+"""
 import sys
-import xlsxwriter
-import datetime
+import csv
+import sqlite3
+import pathlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from stock import Stock
-from stock import Webpage
+from symbols import Symbols
+from instrument import recorder, current_stock, Memory
 
 import os
-import numpy as np
 import warnings
 warnings.filterwarnings("ignore")
 
-now = datetime.datetime.now()
+COMMANDS = ['resolve', 'fetch', 'analyse', 'report', 'screen', 'revalue', 'serve']
 
 
 def search(term: str, df, index = 1):
-    result = df[df[0].str.contains('(?i)' + term)][index].values[0]
-    result = str(result)
-    result = result.replace(",", "")
-    if '%' in result:
-        result = result.replace("%", "")
-        result = float(result) / 100
-    try:
-        return float(result)
-    except:
-        return result
+    """one-off lookup in a df or statements.Statement, use Stock.line_items for repeated lookups"""
 
+    from lineitems import value
+    from statements import Statement
 
-def rename_excel(my_stock, excel_name):
-    """rename excel sheet with npv and last price for easy viewing"""
+    if isinstance(df, Statement):
+        return df.search(term, index)
+    result = df[df[0].str.contains('(?i)' + term)][index].values[0]
+    return value(result)
 
-    operating_cf = search("Cash From Operating Activities", my_stock.cash_flow)
-    shares_outstanding = search("Shares Outstanding", my_stock.overview)/1000000
-    last_price = search("Last Price", my_stock.overview)
 
-    cash_flow = []
-    for i in range(1, 11):
-        operating_cf = operating_cf * (1 + my_stock.growth_rate)
-        cash_flow.append(operating_cf)
+def workbook_path(my_stock):
+    """
+    new file under stocks/ to write a stock's workbook to before rename_excel, one per call
+    so companies analysed at once that resolve to the same stock_cd don't share it
+    """
+    import tempfile
 
-    values = cash_flow
-    rate = my_stock.discount_rate
+    os.makedirs("stocks", exist_ok=True)
+    fd, excel_name = tempfile.mkstemp(dir="stocks", prefix=my_stock.stock_cd + "-", suffix=".xlsx")
+    os.close(fd)
+    return excel_name
 
-    npv = (values / (1+rate)**np.arange(1, len(values)+1)).sum(axis=0) / shares_outstanding
-    print(f"NPV per Share: {npv}")
-    print(f"Last Price: {last_price}")
 
-    os.rename(excel_name, my_stock.stock_cd + "-" + str(round(npv, 2)) + "-" + str(last_price) + ".xlsx") 
-
-
-def analyse(company_name):
-    my_stock = Stock(company_name)
-
-    excel_name = "stocks/" + my_stock.stock_cd + ".xlsx"
-    sheet_name = "Sheet1"
-
-    # colours
-    blue = '#98C4D1'
-    yellow = '#FEC240'
-    red = '#DE4B43'
-
-    # writer = pd.ExcelWriter(excel_name, engine='xlsxwriter') writer.save()
-    workbook = xlsxwriter.Workbook(excel_name)
-    worksheet = workbook.add_worksheet(sheet_name)
-
-    # format excel
-    worksheet.set_row(0, 40)
-    worksheet.set_column('A:A', 20)
-    worksheet.set_column('A:I', 10)
-
-    title_format = workbook.add_format({
-        'bold': True,
-        'font_color': blue,
-        'font_size': 16
-        })
-    currency_format = workbook.add_format({
-        'num_format': '$#,##0.00',
-        'border': 1
-        })
-    percentage_format = workbook.add_format({
-        'num_format': '0.0%',
-        'bg_color': blue,
-        'border': 1
-        })
-    colored_format = workbook.add_format({
-        'bg_color': blue,
-        'border': 1
-        })
-    colored_currency_format = workbook.add_format({
-        'num_format': '$#,##0.00',
-        'bg_color': blue,
-        'border': 1
-        })
-    border_format = workbook.add_format({
-        'border': 1
-        })
-
-
-    # Stock and write to excel
-
-    # Required data for npv calculation, table 1
-    # --------------------------------------------------------
-    table01 = (0, 0)
-    table1 = {
-        "Name of Stock": my_stock.stock_cd.replace("-", " ").title(),
-        "Operating Cash Flow": search("Cash From Operating Activities", my_stock.cash_flow),
-        "Total Debt": search("Total Long Term Debt", my_stock.balance_sheet),
-        "Cash & Equivalent": search("Cash & Equivalent", my_stock.balance_sheet),
-        "Growth Rate": 0,
-        "No. of Shares Outstanding": search("Shares Outstanding", my_stock.overview) / 1000000,
-        "Discount Rate": 0
-    }
+def rename_excel(my_stock, excel_name):
+    """rename excel sheet with npv and last price for easy viewing"""
 
-    worksheet.write_column('A1', table1.keys(), border_format)
-    worksheet.write_column('B1', table1.values(), colored_currency_format)
-
-    # rewrite in title and percentage format
-    worksheet.write('B1', my_stock.stock_cd.replace("-", " ").title(), title_format)
-    worksheet.write('B5', my_stock.growth_rate, percentage_format)
-    worksheet.write('B7', my_stock.discount_rate, percentage_format)
-
-
-    # Ten-year cash flow calculations, bottom table
-    # --------------------------------------------------------
-    table11 = (11, 0)
-    calc_row = table11[0]
-
-    # headers
-    worksheet.write_column(calc_row, 0, ["Year", "Cash Flow", "Discount Rate", "Discounted Value"], border_format)
-    worksheet.write_row(calc_row, 1, list(range(now.year, now.year + 10, 1)), border_format)
-
-    # calculation formulas
-    cash_flow = ["=B2*(1+B5)"]
-    cash_flow.extend(["=" + chr(ord('B') + i) + str(calc_row+2) + "*(1+$B$5)" for i in range(10)])
-    # +1, +2
-    cf_row = calc_row + 1
-    for i in range(10):
-        worksheet.write_formula(cf_row, i+1, cash_flow[i], currency_format)
-        
-    # +2, +3
-    dr_row = calc_row + 2
-    discount_rate = ["=1/(1 + $B$7)^" + str(i) for i in range(1, 11)]
-    for i in range(10):
-        worksheet.write_formula(dr_row, i+1, discount_rate[i], border_format)
-
-    # +3, +4
-    dv_row = calc_row + 3
-    discounted_value = ["=PRODUCT("+chr(ord('B')+i)+str(cf_row+1)+":"+chr(ord('B')+i)+str(dr_row+1)+")" for i in range(10)]
-    for i in range(10):
-        worksheet.write_formula(dv_row, i+1, discounted_value[i], currency_format)
-
-
-    # NPV and intrinsic values calculations, table 2
-    # --------------------------------------------------------
-    # table02 = ()
-    worksheet.write_column('D2', ["PV of 10 yr Cash Flows", "Intrinsic Value per Share", 
-                                  "- Debt per Share", "+ Cash per share", "net Cash per Share"], border_format)
-    worksheet.write_column('E2', [f"=SUM(B{dv_row+1}:K{dv_row+1})", "=E2/B6", "=B3/B6", "=B4/B6", "=E3-E4+E5"], colored_currency_format)
-
-
-    # Stock overview, table 3
-    # --------------------------------------------------------
-    # table03 = ()
-    df = my_stock.overview.reset_index(drop=True)
-    index = [0, 5, 6, 7, 8, 9, 11, 15]
-    worksheet.write_column('G2', df.iloc[index, 0], border_format)
-    worksheet.write_column('H2', df.iloc[index, 1], colored_format)
-
-
-    # Jot down links from simply wall st and infront analytics
-    # --------------------------------------------------------
-    row = table11[0] + 5
-    worksheet.write_column(row, 0, my_stock.urls)
-
-
-    # Overview by i3investor
-    # --------------------------------------------------------
-    i3summary = my_stock.i3summary
-    i3business_performance = my_stock.i3business_performance
-
-    # i3investor table, table 4
-    # table04 = ()
-    i3summary_column = 9
-    worksheet.set_column(i3summary_column, i3summary_column+1, 20)  # Width of column B set to 30.
-
-    worksheet.write_column(1, i3summary_column, i3summary[0], border_format)
-    worksheet.write_column(1, i3summary_column+1, i3summary[1], colored_currency_format)
-
-    # summary tables
-    start_row = 23
-    start_column = 0
-
-    for key in i3business_performance:
-        worksheet.write(start_row, start_column, key)
-        
-        cur_df = i3business_performance[key]
-        for col in cur_df.columns:
-            cur_col = []
-            cur_col.append(col.replace("Unnamed: 0", ""))
-            cur_col.extend(cur_df[col])
-            worksheet.write_column(start_row+1, start_column, cur_col, border_format)
-            start_column += 1
-        start_column += 1
-
-
-    # Ratios by investing, table 5
-    # --------------------------------------------------------
-    # table05
-    start_row = 1
-    start_column = 12
-    ratios_header = my_stock.ratios.head(6)
-    ratios_header = ratios_header.rename({0: '', 1: 'Company', 2: 'Industry'}, axis=1)
-    for col in ratios_header.columns:
-        cur_col = []
-        cur_col.append(col)
-        cur_col.extend(ratios_header[col])
-        worksheet.write_column(start_row, start_column, cur_col, border_format)
-        start_column += 1
-
-    total_assets = search("Total Assets", my_stock.balance_sheet)
-    total_liabilities = search("Total Liabilities", my_stock.balance_sheet)
-    current_shares_outstanding = search("Total Common Shares Outstanding", my_stock.balance_sheet)
-    total_equity = search("Total Equity", my_stock.balance_sheet)
-
-    net_assets = total_assets - total_liabilities
-    net_asset_value = net_assets / current_shares_outstanding
-    net_asset_value = round(net_asset_value, 2)
-
-    table5 = {
-        "EPS": search("Basic EPS ANN", my_stock.ratios),
-        "EPS(MRQ) vs Qtr. 1 Yr. Ago MRQ": search("EPS\(MRQ\) vs Qtr. 1 Yr. Ago MRQ", my_stock.ratios),
-        "EPS(TTM) vs TTM 1 Yr. Ago TTM": search("EPS\(TTM\) vs TTM 1 Yr. Ago TTM", my_stock.ratios),
-        "5 Year EPS Growth 5YA": search("5 Year EPS Growth 5YA", my_stock.ratios),
-            
-        "Return on Equity TTM": search("Return on Equity TTM", my_stock.ratios),
-        "Return on Equity 5YA": search("Return on Equity 5YA", my_stock.ratios),
-            
-        "Price to Earnings Ratio": search("P/E Ratio TTM", my_stock.ratios),
-            
-        "Dividend per Share": search("Dividend Yield ANN", my_stock.ratios),
-        "Dividend Yield 5 Year Avg. 5YA": search("Dividend Yield 5 Year Avg. 5YA", my_stock.ratios),
-        "Dividend Growth Rate ANN": search("Dividend Growth Rate ANN", my_stock.ratios),
-            
-        "Net Asset per Share": net_asset_value,
-        "Price to Book": search("Price to Book MRQ", my_stock.ratios),
-        "LT Debt to Equity": search("LT Debt to Equity", my_stock.ratios)
-    }
+    import dcf
 
-    # Continuation, table 5
-    start_row = len(ratios_header) + 2
-    start_column = 12
-    worksheet.write_column(start_row, start_column, table5.keys(), border_format)
-    worksheet.write_column(start_row, start_column+1, table5.values(), colored_format)
+    npv, last_price = dcf.valuation(my_stock)
+    print(f"NPV per Share: {npv}")
+    print(f"Last Price: {last_price}")
 
-    workbook.close()
-    # Shift + Ctrl + F9
+    new_name = my_stock.stock_cd + "-" + str(round(npv, 2)) + "-" + str(last_price) + ".xlsx"
+    os.rename(excel_name, new_name)
+    return npv, last_price, new_name
 
-    rename_excel(my_stock, excel_name)
 
+def analyse(company_name, max_workers=8, store=None, refresh=False, workbook=None, my_stock=None, history=None,
+            incremental=False):
+    """
+    value a company and write its excel sheet, into workbook (a report.ReportWriter) if given
 
-def main():
-    # print('Number of arguments: {}'.format(len(sys.argv[1:])))
-    # print('Argument(s) passed: {}'.format(str(sys.argv[1:])))
+    my_stock is the company's Stock when it was already scraped (by aio.fetch_all),
+    or the exception that stopped it. With a history.History, the stock's daily
+    prices and earnings are brought up to date too. With incremental, the last
+    report is kept when none of its inputs changed (store.fingerprint).
+    """
+    token = current_stock.set(company_name)
+    try:
+        return analyse_stock(company_name, max_workers, store, refresh, workbook, my_stock, history, incremental)
+    finally:
+        current_stock.reset(token)
+
+
+def fetch(company_name, max_workers=8, store=None, refresh=False, my_stock=None, history=None):
+    """Stock of a company scraped (or only its stale sources with refresh) and stored, its history updated"""
+
+    from stock import Stock
+    from transport import transport
+
+    if isinstance(my_stock, BaseException):
+        raise my_stock
+    if my_stock is not None:
+        if store is not None:
+            store.save(my_stock)
+    elif store is not None and refresh:
+        my_stock = store.refresh(company_name, max_workers=max_workers)
+    else:
+        my_stock = Stock(company_name, max_workers=max_workers)
+        if store is not None:
+            store.save(my_stock)
+
+    if history is not None:
+        days, releases = transport.run(history.update(my_stock.stock_cd, my_stock.stock_id))
+        print(f"History: {days} new days, {releases} new earnings releases")
+    return my_stock
+
+
+def analyse_stock(company_name, max_workers, store, refresh, workbook, my_stock, history, incremental):
+    import report
+    from store import fingerprint
+
+    my_stock = fetch(company_name, max_workers, store, refresh, my_stock, history)
+
+    # a workbook of many stocks is written whole, only reports of their own can be kept
+    fingerprinted = store is not None and workbook is None
+    if fingerprinted:
+        digest, inputs = fingerprint(my_stock)
+        previous = store.report(company_name)
+        if incremental and previous is not None:
+            last_digest, last_inputs, last_result = previous
+            if last_digest == digest and os.path.exists(last_result["excel"]):
+                print(f"Unchanged, keeping {last_result['excel']}")
+                return last_result
+            print(f"Changed: {', '.join(name for name in inputs if inputs[name] != last_inputs.get(name))}")
+
+    if workbook is not None:
+        npv, last_price, sheet_name = workbook.add(my_stock)
+        excel_name = f"{workbook.path}#{sheet_name}"
+    else:
+        excel_name = workbook_path(my_stock)
+        report.write_workbook(excel_name, my_stock)
+        npv, last_price, excel_name = rename_excel(my_stock, excel_name)
+    result = {
+        "company": company_name,
+        "stock_cd": my_stock.stock_cd,
+        "npv": npv,
+        "last_price": last_price,
+        "margin_of_safety": (npv - last_price) / npv if npv else None,
+        "excel": excel_name,
+    }
+    if fingerprinted:
+        store.save_report(company_name, digest, inputs, result)
+    return result
+
+
+def read_watchlist(path):
+    """one company per line, blank lines and # comments skipped"""
+
+    with open(path) as f:
+        lines = [line.split("#")[0].strip() for line in f]
+    return [line for line in lines if line]
+
+
+def batch(companies, workers=4, summary="summary.csv", max_workers=8, store=None, refresh=False, workbook=None,
+          per_host=None, history=None, incremental=False, memory=None, reports=True, scheduled=False):
+    """
+    analyse companies in parallel, carry on past failures and write npv vs last price for all of them
+
+    without reports, the companies are only fetched into the store.
+    with per_host, every stock is first fetched on one event loop with at most
+    per_host requests in flight to each site (aio.py, needs aiohttp); with
+    scheduled, on workers * max_workers threads taking the requests of every
+    stock by site (scheduler.py). With a
+    history.History, the market's and every stock's price history is updated.
+    With incremental, reports whose inputs didn't change are kept. With an
+    instrument.Memory, the peak resident size of every stock goes into the
+    summary and stocks wait for the process to be under its budget.
+    """
+    from history import MARKET
+    from transport import transport
+
+    if history is not None:
+        days = transport.run(history.update_prices(*MARKET))
+        print(f"Market: {days} new days")
+
+    stocks = {}
+    if per_host:
+        import asyncio
+        import aio
+        stocks = asyncio.run(aio.fetch_all(companies, per_host=per_host))
+    elif scheduled:
+        import scheduler
+        stocks = scheduler.fetch_all(companies, workers=workers * max_workers)
+
+    def fetch_only(company, workbook=None, incremental=False, **kwargs):
+        token = current_stock.set(company)
+        try:
+            return {"company": company, "stock_cd": fetch(company, **kwargs).stock_cd}
+        finally:
+            current_stock.reset(token)
+
+    action = analyse if reports else fetch_only
+
+    def analyse_within(company, **kwargs):
+        if memory is None:
+            return action(company, **kwargs)
+        memory.admit()
+        with memory.track(company) as usage:
+            result = action(company, **kwargs)
+        print(f"{company}: peak RSS {usage['peak'] / 2**20:.0f} MB")
+        return {**result, "peak_rss_mb": round(usage['peak'] / 2**20, 1)}
+
+    writer = None
+    if workbook:
+        import report
+        writer = report.ReportWriter(workbook)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analyse") as pool:
+        futures = {pool.submit(analyse_within, company, max_workers=max_workers, store=store, refresh=refresh,
+                               workbook=writer, my_stock=stocks.get(company), history=history,
+                               incremental=incremental): company
+                   for company in companies}
+        for future in as_completed(futures):
+            company = futures[future]
+            try:
+                results[company] = future.result()
+            except Exception as e:
+                print(f"{company}: failed with {e!r}")
+                results[company] = {"company": company, "error": repr(e)}
+    if writer is not None:
+        writer.close()
+
+    fields = ["company", "stock_cd", "npv", "last_price", "margin_of_safety", "excel", "error"]
+    if memory is not None:
+        fields.insert(-1, "peak_rss_mb")
+    with open(summary, "w", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        for company in companies:
+            writer.writerow(results[company])
+
+    failed = [company for company in companies if "error" in results[company]]
+    print(f"{'Analysed' if reports else 'Fetched'} {len(companies) - len(failed)} of {len(companies)} companies, "
+          f"summary in {summary}")
+    return [results[company] for company in companies]
+
+
+def stored_valuations(path, companies=None):
+    """[(company, stock_cd, date, npv, last_price)] of the latest stored fundamentals, read with sqlite alone"""
+
+    if not os.path.exists(path):
+        return []
+    connection = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+    sql = "SELECT company, stock_cd, date, npv, last_price FROM latest"
+    if companies:
+        sql += f" WHERE company IN ({', '.join('?' for _ in companies)})"
+    try:
+        return connection.execute(sql + " ORDER BY company", companies or ()).fetchall()
+    except sqlite3.OperationalError:
+        return []  # nothing was ever stored
+    finally:
+        connection.close()
+
+
+def resolve(companies, symbols, refresh=False, configure=None):
+    """print the identifiers of every company, looking stock_cd up where the symbol table hasn't got it"""
+
+    for company in companies:
+        if refresh:
+            symbols.forget(company, 'stock_cd')
+
+        def search(company=company):
+            from stock import Stock
+            from transport import transport
+            if configure is not None:
+                configure()
+            return transport.run(Stock(company, sources=[]).scrape_link(company))
+
+        symbols.resolve(company, 'stock_cd', search)
+        identifiers = symbols.items(company)
+        print(company, " ".join(f"{key}={value}" for key, value in sorted(identifiers.items())))
+
+
+def configure_transport(args):
+    from transport import transport
+    from cache import HttpCache
+
+    if getattr(args, "polite", None):
+        from scheduler import AdaptiveLimiter
+        transport.rate_limiter = AdaptiveLimiter(args.polite, max_rate=args.rate)
+    else:
+        transport.rate_limiter.rate = args.rate
+    transport.timeout = (min(5, args.timeout), args.timeout)
+    transport.retries = args.retries
+    if not args.no_cache and transport.cache is None:
+        transport.cache = HttpCache(args.cache, offline=args.offline)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", metavar="{" + ",".join(COMMANDS) + "}")
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("companies", nargs="*", help="company names or tickers")
+    common.add_argument("-w", "--watchlist", help="file with one company per line")
+    common.add_argument("--store", default="stocks.db", help="sqlite file the scraped data is kept in")
+
+    network = argparse.ArgumentParser(add_help=False)
+    network.add_argument("--fetch-workers", type=int, default=8, help="requests in flight per company")
+    network.add_argument("--rate", type=float, help="max requests per second to each host")
+    network.add_argument("--timeout", type=float, default=30, help="seconds before a request is given up")
+    network.add_argument("--retries", type=int, default=3, help="retries per request with exponential backoff")
+    network.add_argument("--cache", default=".cache/http", help="directory of cached responses")
+    network.add_argument("--no-cache", action="store_true", help="always download")
+    network.add_argument("--offline", action="store_true", help="serve every request from the cache, fail on misses")
+    network.add_argument("--revalidate", action="store_true",
+                         help="use stale stored identifiers and look them up again in the background")
+
+    scraping = argparse.ArgumentParser(add_help=False)
+    scraping.add_argument("-j", "--workers", type=int, default=4, help="companies analysed at the same time")
+    scraping.add_argument("--async", dest="per_host", type=int, nargs="?", const=8, metavar="PER_HOST",
+                          help="fetch every stock on one event loop, at most PER_HOST (8) requests in flight per site, needs aiohttp")
+    scraping.add_argument("--polite", type=float, nargs="?", const=2, metavar="RATE",
+                          help="start every site at RATE (2) requests/s, adapt it to how the site answers "
+                               "(up to --rate) and interleave the requests of every stock by site")
+    scraping.add_argument("--refresh", action="store_true", help="only scrape the sources that are stale in the store")
+    scraping.add_argument("--no-symbols", action="store_true", help="look every stock up on every site again")
+    scraping.add_argument("--history", nargs="?", const="timeseries", metavar="DIR",
+                          help="keep daily prices and earnings of every stock and the market up to date in DIR (timeseries)")
+    scraping.add_argument("--metrics", help="write stage timings, bytes and retries per source to this .json or .csv")
+    scraping.add_argument("--profile", help="run under cProfile and dump the stats to this file")
+    scraping.add_argument("--memory", type=float, nargs="?", const=0, metavar="MB",
+                          help="report the peak RSS of every stock, and with MB hold stocks back while the process is above it")
+    scraping.add_argument("-o", "--report", default="summary.csv", help="summary csv of npv against last price")
+
+    resolve = commands.add_parser("resolve", parents=[common, network], help="identifiers of each company on every site")
+    resolve.add_argument("--refresh", action="store_true", help="look stock_cd up again even if it is stored")
+
+    commands.add_parser("fetch", parents=[common, network, scraping], help="scrape into the store, no reports")
+
+    analyse = commands.add_parser("analyse", parents=[common, network, scraping],
+                                  help="scrape, value and write the reports (the default command)")
+    analyse.add_argument("--incremental", action="store_true",
+                         help="--refresh, and keep the reports of stocks whose inputs didn't change")
+    analyse.add_argument("--workbook", help="write every stock into this one workbook instead of a file each")
+
+    report = commands.add_parser("report", parents=[common], help="stored npv against last price, without scraping")
+    report.add_argument("--excel", action="store_true", help="write the workbooks again from the stored data")
+
+    screen = commands.add_parser("screen", help="every stored stock matching an expression, by margin of safety")
+    screen.add_argument("where", nargs="?", help="filter over the screener.COLUMNS, e.g. 'roe > 0.1 and pb < 1'")
+    screen.add_argument("--store", default="stocks.db", help="sqlite file the scraped data is kept in")
+    screen.add_argument("--rank", default="margin_of_safety", help="column or expression to sort by, highest first")
+    screen.add_argument("--ascending", action="store_true", help="sort lowest first")
+    screen.add_argument("--top", type=int, default=20, help="stocks to print, 0 for all")
+    screen.add_argument("--columns", default="company,last_price,npv,margin_of_safety,pe,pb,roe,dividend_yield",
+                        help="comma separated columns to print")
+
+    revalue = commands.add_parser("revalue", help="beta, discount rate and npv of every stored stock from the stored prices")
+    revalue.add_argument("--store", default="stocks.db", help="sqlite file the scraped data is kept in")
+    revalue.add_argument("--history", default="timeseries", metavar="DIR", help="daily prices kept by --history")
+    revalue.add_argument("--window", type=int, default=252, help="daily returns beta is computed over")
+
+    serve = commands.add_parser("serve", parents=[common, network],
+                                help="keep stocks in memory and answer http/json, see server.py")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("-j", "--workers", type=int, default=4, help="companies loaded at the same time")
+    serve.add_argument("--capacity", type=int, default=256, help="stocks kept in memory")
+    serve.add_argument("--interval", type=float, default=60, help="seconds between scrapes of the stale sources")
+    serve.add_argument("--no-symbols", action="store_true", help="look every stock up on every site again")
+    serve.add_argument("--history", nargs="?", const="timeseries", metavar="DIR",
+                       help="compute beta from the daily prices in DIR (timeseries)")
+
+    # the command is optional, scrape.py COMPANY... analyses
+    if not argv or argv[0] not in COMMANDS + ["-h", "--help"]:
+        argv = ["analyse"] + list(argv)
+    return parser, parser.parse_args(argv)
+
+
+def main(argv=None):
+    parser, args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == "screen":
+        from store import Store
+        from screener import Screener
+
+        store = Store(args.store)
+        result = Screener.from_store(store).screen(args.where, args.rank, args.ascending, args.top)
+        store.close()
+        print(result[["stock_cd"] + args.columns.split(",") + ["score"]].to_string(index=False))
+        return
+
+    if args.command == "revalue":
+        from store import Store
+        from history import History
+
+        store = Store(args.store)
+        columns = ["stock_cd", "company", "beta", "discount_rate", "npv", "last_price"]
+        print(store.revalue(History(args.history), args.window)[columns].to_string(index=False))
+        store.close()
+        return
+
+    companies = list(args.companies)
+    if args.watchlist:
+        companies.extend(read_watchlist(args.watchlist))
+    companies = list(dict.fromkeys(companies))
+
+    if args.command == "resolve":
+        symbols = Symbols(args.store, revalidate=args.revalidate)
+        resolve(companies, symbols, args.refresh, lambda: configure_transport(args))
+        symbols.close()
+        return
+
+    if args.command == "report":
+        if args.excel:
+            return rewrite_reports(companies, args.store)
+        print(f"{'company':<24} {'stock_cd':<24} {'date':<10} {'npv':>10} {'price':>8} {'margin':>8}")
+        for company, stock_cd, date, npv, last_price in stored_valuations(args.store, companies):
+            margin = f"{(npv - last_price) / npv:>8.1%}" if npv and last_price is not None else f"{'':>8}"
+            print(f"{company:<24} {stock_cd:<24} {date:<10} {npv if npv is not None else float('nan'):>10.2f} "
+                  f"{last_price if last_price is not None else float('nan'):>8.2f} {margin}")
+        return
+
+    if args.command == "serve":
+        return serve(companies, args)
+
+    args.incremental = getattr(args, "incremental", False)
+    args.refresh = args.refresh or args.incremental
+    if args.per_host and args.refresh:
+        parser.error("--refresh reads the store stock by stock, it can't be combined with --async")
+    if args.polite and args.refresh:
+        parser.error("--refresh reads the store stock by stock, it can't be combined with --polite")
+
+    from stock import Stock
+    from store import Store
+    from history import History
+
+    configure_transport(args)
+    history = History(args.history) if args.history else None
+    Stock.history = history
+
+    store = Store(args.store)
+    if not args.no_symbols:
+        Stock.symbols = Symbols(args.store, revalidate=args.revalidate)
+
+    recorder.enabled = bool(args.metrics)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    batch(companies, workers=args.workers, summary=args.report, max_workers=args.fetch_workers,
+          store=store, refresh=args.refresh, workbook=getattr(args, "workbook", None), per_host=args.per_host,
+          history=history, incremental=args.incremental,
+          memory=Memory(args.memory * 2**20 or None) if args.memory is not None else None,
+          reports=args.command == "analyse", scheduled=bool(args.polite) and not args.per_host)
+
+    if Stock.symbols is not None:
+        Stock.symbols.close()
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if args.metrics:
+        recorder.write(args.metrics)
+        recorder.print_summary()
+
+
+def serve(companies, args):
+    """answer http/json from the stocks kept in memory until interrupted, see server.py"""
+
+    import server
+    from stock import Stock
+    from store import Store
+    from history import History
+
+    configure_transport(args)
+    Stock.history = History(args.history) if args.history else None
+    if not args.no_symbols:
+        Stock.symbols = Symbols(args.store, revalidate=args.revalidate)
+    server.serve(companies, Store(args.store), port=args.port, host=args.host, capacity=args.capacity,
+                 interval=args.interval, workers=args.workers, max_workers=args.fetch_workers)
+
+
+def rewrite_reports(companies, path):
+    """workbooks of stored stocks, without scraping them again"""
+
+    import report
+    from store import Store
+
+    store = Store(path)
+    for company in companies or [row[0] for row in stored_valuations(path)]:
+        my_stock = store.load(company)
+        if my_stock is None:
+            print(f"{company}: not in {path}")
+            continue
+        excel_name = workbook_path(my_stock)
+        report.write_workbook(excel_name, my_stock)
+        rename_excel(my_stock, excel_name)
+    store.close()
 
-    companies = sys.argv[1:]
-    list(map(lambda x: analyse(x),companies))
-  
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
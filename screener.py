@@ -0,0 +1,67 @@
+"""
+Exchange-wide screens over the stored fundamentals.
+
+Screener loads the latest key figures of every stored stock (store.METRICS,
+the ratios of the report's table 5 and nav per share) into one frame of
+float columns, adds the margin of safety of the npv over the last price,
+and evaluates filter and ranking expressions on whole columns at once:
+
+    screener = Screener.from_store(store)
+    screener.screen("roe > 0.1 and pb < 1 and lt_debt_to_equity < 0.5", top=20)
+    screener.screen("eps > 0", rank="roe / pe", ascending=False)
+
+Expressions are pandas.eval ones over the column names of COLUMNS, so a
+screen of every KLSE counter is a handful of numpy operations on arrays
+of 1000 values rather than a workbook per stock.
+"""
+import numpy as np
+import pandas as pd
+
+from store import COLUMNS as STORED
+
+# stored columns plus the ones derived from them
+DERIVED = {
+    'margin_of_safety': "(npv - last_price) / npv",
+    'price_to_nav': "last_price / nav_per_share",
+    'earnings_yield': "eps / last_price",
+    'net_cash_per_share': "(cash - total_debt) / shares_outstanding",
+}
+COLUMNS = STORED + list(DERIVED)
+
+
+class Screener:
+    def __init__(self, frame):
+        """frame has a row per stock with stock_cd, company and the stored columns"""
+
+        frame = frame.reset_index(drop=True)
+        numbers = frame[STORED].apply(pd.to_numeric, errors='coerce').astype(np.float64)
+        frame = pd.concat([frame.drop(columns=STORED), numbers], axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for column, expression in DERIVED.items():
+                frame[column] = frame.eval(expression).replace([np.inf, -np.inf], np.nan)
+        self.frame = frame
+
+    @classmethod
+    def from_store(cls, store):
+        """latest fundamentals of every stock in a store.Store"""
+
+        return cls(store.query("SELECT * FROM latest"))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def screen(self, where=None, rank='margin_of_safety', ascending=False, top=None):
+        """
+        stocks matching the where expression, sorted by the rank expression (a
+        column or any expression of them) with stocks it's nan for last
+        """
+        frame = self.frame
+        if where:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frame = frame[frame.eval(where).fillna(False).astype(bool)]
+        if rank:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score = np.asarray(frame.eval(rank), dtype=np.float64)
+            order = np.argsort(score if ascending else -score, kind='stable')  # nan sorts last
+            frame = frame.iloc[order].assign(score=score[order])
+        return frame.head(top) if top else frame
@@ -0,0 +1,252 @@
+"""
+Local screening service: stocks kept in memory, answered over http/json.
+
+A cold `scrape.py` run pays the imports and the scraping of every source
+for each question. serve() keeps the Stocks of the watchlist, and of any
+company asked for since, in an LRU of up to capacity stocks. A background
+thread scrapes again only the sources that are past their store.TTLS, on a
+copy that replaces the cached stock when it's done, so reads never wait
+for a refresh:
+
+    python scrape.py serve -w watchlist.txt --port 8765
+    curl localhost:8765/stocks/airasia/npv
+
+    GET  /stocks                      cached companies and when they were refreshed
+    GET  /stocks/<company>            key figures (store.fundamentals)
+    GET  /stocks/<company>/npv        npv per share, last price and margin of safety
+    GET  /stocks/<company>/ratios     {ratio: {Company, Industry}}
+    POST /stocks/<company>/refresh    scrape every source again
+    POST /stocks/<company>/report     write the stock's workbook, its path
+
+A company that isn't cached yet is rebuilt from the store, scraping only
+what's stale there, so the first request for it takes as long as a run.
+"""
+import os
+import copy
+import json
+import time
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import dcf
+import report
+from store import TTLS, fundamentals
+from instrument import current_stock
+
+
+class StockCache:
+    """LRU of Stocks by company, loaded through a store.Store and refreshed in the background"""
+
+    def __init__(self, store, capacity=256, ttls=TTLS, max_workers=8):
+        self.store = store
+        self.capacity = capacity
+        self.ttls = ttls
+        self.max_workers = max_workers
+        self.stocks = OrderedDict()  # company -> (Stock, time of the last refresh)
+        self.loading = {}  # company -> lock, so a company missing from the cache is loaded once
+        self.lock = threading.Lock()
+
+    def __contains__(self, company):
+        with self.lock:
+            return company in self.stocks
+
+    def put(self, company, stock):
+        with self.lock:
+            self.stocks[company] = (stock, time.time())
+            self.stocks.move_to_end(company)
+            while len(self.stocks) > self.capacity:
+                self.stocks.popitem(last=False)
+
+    def get(self, company):
+        """the cached Stock, or loaded from the store with its stale sources scraped"""
+
+        with self.lock:
+            if company in self.stocks:
+                self.stocks.move_to_end(company)
+                return self.stocks[company][0]
+            loading = self.loading.setdefault(company, threading.Lock())
+        with loading:
+            with self.lock:
+                if company in self.stocks:
+                    return self.stocks[company][0]
+            token = current_stock.set(company)
+            try:
+                stock = self.store.refresh(company, max_workers=self.max_workers)
+            finally:
+                current_stock.reset(token)
+                with self.lock:
+                    self.loading.pop(company, None)
+            self.put(company, stock)
+            return stock
+
+    def refresh(self, company, sources=None):
+        """scrape the stale sources of a cached stock (or the given ones) into a copy and swap it in"""
+
+        with self.lock:
+            if company not in self.stocks:
+                return None
+            stock = self.stocks[company][0]
+        if sources is None:
+            sources = self.store.stale(stock.stock_cd, self.ttls)
+        if not sources:
+            return stock
+        fresh = copy.copy(stock)
+        token = current_stock.set(company)
+        try:
+            fresh.fetch(sources, max_workers=self.max_workers)
+        finally:
+            current_stock.reset(token)
+        self.store.save(fresh, sources)
+        with self.lock:
+            if company in self.stocks:
+                self.stocks[company] = (fresh, time.time())
+        return fresh
+
+    def refresh_all(self):
+        with self.lock:
+            companies = list(self.stocks)
+        for company in companies:
+            try:
+                self.refresh(company)
+            except Exception as e:
+                print(f"{company}: refresh failed with {e!r}")
+
+    def items(self):
+        with self.lock:
+            return [(company, refreshed) for company, (_, refreshed) in self.stocks.items()]
+
+
+def plain(value):
+    """value with numpy numbers as python ones and nan as None, for json"""
+
+    if isinstance(value, dict):
+        return {key: plain(i) for key, i in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(i) for i in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def valuation(stock):
+    npv, last_price = dcf.valuation(stock)
+    return {
+        "company": stock.company,
+        "stock_cd": stock.stock_cd,
+        "npv": npv,
+        "last_price": last_price,
+        "margin_of_safety": (npv - last_price) / npv if npv else None,
+        "growth_rate": stock.growth_rate,
+        "discount_rate": stock.discount_rate,
+    }
+
+
+def ratios(stock):
+    statement = stock.ratios
+    return {label: {column: statement.cell(i, j) for j, column in enumerate(statement.columns)}
+            for i, label in enumerate(statement.labels)}
+
+
+report_lock = threading.Lock()  # two requests for one stock would write the same file
+
+
+def write_report(stock, directory="stocks"):
+    os.makedirs(directory, exist_ok=True)
+    excel_name = os.path.join(directory, stock.stock_cd + ".xlsx")
+    with report_lock:
+        report.write_workbook(excel_name, stock)
+    return {**valuation(stock), "excel": excel_name}
+
+
+class Handler(BaseHTTPRequestHandler):
+    cache = None  # StockCache, set by serve
+    quiet = False
+
+    routes = {
+        ('GET', None): lambda cache, stock: fundamentals(stock),
+        ('GET', 'npv'): lambda cache, stock: valuation(stock),
+        ('GET', 'ratios'): lambda cache, stock: ratios(stock),
+        ('POST', 'refresh'): lambda cache, stock: valuation(cache.refresh(stock.company, list(stock.sources))),
+        ('POST', 'report'): lambda cache, stock: write_report(stock),
+    }
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def route(self, method):
+        parts = [unquote(i) for i in urlsplit(self.path).path.strip('/').split('/')]
+        if parts == ['stocks'] and method == 'GET':
+            return self.reply(200, [{"company": company, "refreshed": refreshed}
+                                    for company, refreshed in self.cache.items()])
+        if parts[0] != 'stocks' or len(parts) not in (2, 3):
+            return self.reply(404, {"error": f"no such path {self.path}"})
+        company, action = parts[1], (parts[2] if len(parts) == 3 else None)
+        answer = self.routes.get((method, action))
+        if answer is None:
+            return self.reply(404, {"error": f"no {method} {action}"})
+        try:
+            stock = self.cache.get(company)
+            body = answer(self.cache, stock)
+        except Exception as e:
+            return self.reply(502, {"company": company, "error": repr(e)})
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        data = json.dumps(plain(body)).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def refresher(cache, interval):
+    while True:
+        time.sleep(interval)
+        cache.refresh_all()
+
+
+def warm(cache, companies, workers=4):
+    def load(company):
+        try:
+            cache.get(company)
+        except Exception as e:
+            print(f"{company}: failed with {e!r}")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm") as pool:
+        list(pool.map(load, companies))
+    print(f"Cached {sum(1 for i in companies if i in cache)} of {len(companies)} companies")
+
+
+def serve(companies, store, port=8765, host='127.0.0.1', capacity=256, interval=60, workers=4, max_workers=8):
+    """
+    answer on host:port until interrupted, with the companies loaded in the background
+    and the stale sources of every cached stock scraped again every interval seconds
+    """
+    cache = StockCache(store, capacity=capacity, max_workers=max_workers)
+    handler = type('Handler', (Handler,), {'cache': cache})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=warm, args=(cache, companies, workers), daemon=True, name="warm").start()
+    threading.Thread(target=refresher, args=(cache, interval), daemon=True, name="refresh").start()
+    print(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return cache
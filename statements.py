@@ -0,0 +1,209 @@
+"""
+Scraped statements as compact typed records instead of frames of strings.
+
+A Statement keeps the line item labels, the column index and a float64
+matrix of the values, parsed once when the page is scraped: '1,234.5' is
+1234.5, '12%' is 0.12 and the few cells that aren't numbers ('-', "0.655 -
+0.680") are kept as text on the side. The financial statements are indexed
+by the period end dates of their "Period Ending:" row:
+
+    cash_flow = Statement.from_periods(webpage.table(0))
+    cash_flow.search("Cash From Operating Activities")   # latest period
+    cash_flow.row("Capital Expenditures")                # every period, newest first
+
+Like the frames, column 0 is the labels and columns 1 on the values, so
+LineItems and the report read a Statement the same way. Fundamentals holds
+the statements and figures of one stock without the rest of the Stock, so a
+screen keeps thousands of them in memory and pickles or msgpacks them cheaply:
+
+    records = [Fundamentals.of(stock) for stock in stocks]
+    Fundamentals.unpack(record.pack())
+
+Packing needs msgpack (pip install msgpack), pickle works as it is.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from lineitems import number
+
+
+class Statement:
+    __slots__ = ('labels', 'columns', 'values', 'text')
+
+    def __init__(self, labels, columns, values, text=None):
+        self.labels = tuple(labels)
+        self.columns = columns  # tuple of names, or datetime64[D] period ends
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(self.labels), len(columns))
+        self.text = text or {}  # (row, column) -> text of the cells that aren't numbers
+
+    @classmethod
+    def from_rows(cls, labels, rows, columns):
+        """Statement of rows of scraped cells, one per label"""
+
+        values = np.full((len(labels), len(columns)), np.nan)
+        text = {}
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row):
+                if cell is None or cell != cell:
+                    continue  # empty
+                parsed = number(cell)
+                if parsed is None:
+                    text[i, j] = str(cell)
+                else:
+                    values[i, j] = parsed
+        return cls(labels, columns, values, text)
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        """Statement of a scraped df with the labels in column 0, the values in the others"""
+
+        rows = df.iloc[:, 1:].itertuples(index=False, name=None)
+        if columns is None:
+            columns = tuple(str(i) for i in df.columns[1:])
+        return cls.from_rows([str(i) for i in df.iloc[:, 0]], rows, columns)
+
+    @classmethod
+    def from_periods(cls, df):
+        """
+        Statement of an investing.com financial statement, indexed by its "Period Ending:"
+        row ('2019 31/12') and without the other header rows
+        """
+        labels = df.iloc[:, 0].astype(str)
+        header = labels.str.endswith(':')
+        ending = df[labels == 'Period Ending:'].iloc[:, 1:]
+        if len(ending):
+            periods = pd.to_datetime(ending.iloc[0], format='%Y %d/%m', errors='coerce').values.astype('M8[D]')
+        else:
+            periods = np.full(df.shape[1] - 1, 'NaT', dtype='M8[D]')
+        return cls.from_frame(df[~header], periods)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, column):
+        """column 0 is the labels, the others the cells of a value column, like the scraped df"""
+
+        if column == 0:
+            return list(self.labels)
+        return [self.cell(i, column - 1) for i in range(len(self.labels))]
+
+    def __eq__(self, other):
+        return (isinstance(other, Statement) and self.labels == other.labels and self.text == other.text
+                and np.array_equal(np.asarray(self.columns), np.asarray(other.columns))
+                and np.array_equal(self.values, other.values, equal_nan=True))
+
+    def __repr__(self):
+        return f"Statement({len(self.labels)} items x {len(self.columns)} columns)"
+
+    @property
+    def periods(self):
+        """period end dates of the columns, None if the columns aren't periods"""
+
+        columns = np.asarray(self.columns)
+        return columns if columns.dtype.kind == 'M' else None
+
+    def cell(self, i, j):
+        """number, text, or nan of an empty cell"""
+
+        number = self.values[i, j]
+        if number != number:
+            return self.text.get((i, j), np.nan)
+        return float(number)
+
+    def position(self, term):
+        """row of the first line item matching term anywhere, ignoring case"""
+
+        pattern = re.compile(term, re.IGNORECASE)
+        for i, label in enumerate(self.labels):
+            if pattern.search(label):
+                return i
+        raise KeyError(term)
+
+    def search(self, term, column=1):
+        """cell of the first line item matching term anywhere, like scrape.search"""
+
+        return self.cell(self.position(term), column - 1)
+
+    def row(self, term):
+        """float64 values of the first line item matching term, one per column"""
+
+        return self.values[self.position(term)]
+
+    def frame(self):
+        """the statement as a df with the labels in column 0, for display"""
+
+        columns = {0: self[0]}
+        columns.update({j + 1: self[j + 1] for j in range(len(self.columns))})
+        return pd.DataFrame(columns)
+
+    def state(self):
+        """labels, columns and cells as plain lists, for json and msgpack"""
+
+        periods = self.periods
+        return {
+            'labels': list(self.labels),
+            'columns': [str(i) for i in self.columns],
+            'periods': periods is not None,
+            'values': [[None if i != i else i for i in row] for row in self.values.tolist()],
+            'text': [[i, j, text] for (i, j), text in self.text.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        columns = state['columns']
+        columns = np.array(columns, dtype='M8[D]') if state['periods'] else tuple(columns)
+        values = np.array([[np.nan if i is None else i for i in row] for row in state['values']], dtype=np.float64)
+        return cls(state['labels'], columns, values.reshape(len(state['labels']), len(columns)),
+                   {(i, j): text for i, j, text in state['text']})
+
+
+class Fundamentals:
+    """the statements and key figures of one stock, without the pages, indexes and connections of a Stock"""
+
+    __slots__ = ('company', 'stock_cd', 'growth_rate', 'beta', 'discount_rate',
+                 'overview', 'ratios', 'cash_flow', 'balance_sheet', 'i3summary')
+    statements = ('overview', 'ratios', 'cash_flow', 'balance_sheet', 'i3summary')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def of(cls, stock):
+        return cls(**{name: getattr(stock, name, None) for name in cls.__slots__})
+
+    def __eq__(self, other):
+        return isinstance(other, Fundamentals) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def state(self):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        for name in self.statements:
+            if state[name] is not None:
+                state[name] = state[name].state()
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**{name: Statement.from_state(i) if name in cls.statements and i is not None else i
+                      for name, i in state.items()})
+
+    def pack(self):
+        """msgpack bytes of the record"""
+
+        if msgpack is None:
+            raise ImportError("packing needs msgpack: pip install msgpack")
+        return msgpack.packb(self.state())
+
+    @classmethod
+    def unpack(cls, data):
+        if msgpack is None:
+            raise ImportError("packing needs msgpack: pip install msgpack")
+        return cls.from_state(msgpack.unpackb(data))
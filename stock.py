@@ -1,33 +1,97 @@
-import requests
 import pandas as pd
 import re
-from bs4 import BeautifulSoup
-
-def url2html(url, headers=None, params=None, data=None):
-    headers={'User-Agent': 'Mozilla/5.0'}
-    try:
-        req = requests.get(url, headers=headers, params=params, data=data)
-    except:
-        req = requests.get(url, headers=headers, params=params, data=data, verify=False)
+import contextvars
+from bs4 import BeautifulSoup, SoupStrainer
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from transport import transport, Fetch
+from extract import Field, Spec, PARSER, number
+from lineitems import LineItems
+from statements import Statement
+import dcf
+from instrument import recorder, current_stock, current_source
+
+if PARSER == 'lxml':
+    import lxml.html
+
+
+def url2html(url, headers=None, params=None, data=None, **kwargs):
+    req = transport.get(url, headers=headers, params=params, data=data, **kwargs)
     html = req.text
     return html
 
     
 # Handle all urls and htmls
 class Webpage:
-    def __init__(self, html):
+    def __init__(self, html, parser=PARSER):
         self.html = html
-        self.soup = BeautifulSoup(self.html, 'html.parser')
-        try:
-            self.tables = pd.read_html(self.html)
-        except:
-            self.tables = None
+        self.parser = parser
+        self.parsed_tables = {}
+
+    @cached_property
+    def soup(self):
+        """whole document, parsed on first use"""
+
+        with recorder.stage('parse'):
+            return BeautifulSoup(self.html, self.parser)
+
+    @cached_property
+    def tables(self):
+        """every table in the document as a df, parsed on first use"""
+
+        with recorder.stage('parse'):
+            try:
+                return pd.read_html(self.html)
+            except:
+                return None
+
+    def table(self, index=0, selector=None):
+        """parse a single table, by position or css selector, without building the other tables"""
+
+        key = selector or index
+        if key in self.parsed_tables:
+            return self.parsed_tables[key]
+        if selector is None and 'tables' in self.__dict__:
+            return self.tables[index]
+
+        with recorder.stage('parse'):
+            return self.parse_table(key, index, selector)
+
+    def parse_table(self, key, index, selector):
+        if selector is not None:
+            node = self.soup.select_one(selector)
+        elif 'soup' in self.__dict__:
+            node = self.soup.find_all('table')[index]
+        elif self.parser == 'lxml':
+            node = lxml.html.tostring(lxml.html.fromstring(self.html).xpath('//table')[index], encoding='unicode')
+        else:
+            node = BeautifulSoup(self.html, self.parser, parse_only=SoupStrainer('table')).find_all('table')[index]
+        table = pd.read_html(str(node))[0]
+        self.parsed_tables[key] = table
+        return table
     
+    def close(self):
+        """free the parse tree, the tables and the html once the fields are pulled, the page is empty after"""
+
+        soup = self.__dict__.pop('soup', None)
+        if soup is not None:
+            soup.decompose()
+        self.__dict__.pop('tables', None)
+        self.parsed_tables = {}
+        self.html = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     @classmethod
     def from_url(cls, url, headers=None, params=None, data=None):
         """constructor with url"""
 
-        html = url2html(url, headers)
+        html = url2html(url, headers, params, data)
         return cls(html)
     
     def get_span(self, tag: str, class_name: list):
@@ -47,32 +111,197 @@ class Webpage:
 
 
 
+def i3_id(text):
+    """'AIRASIA (5099)' -> '5099'"""
+
+    m = re.search(r"\((\d+)\)", text)
+    if m is None:
+        raise ValueError(f"no i3investor id in {text!r}")
+    return m.group(1)
+
+
+# What each scraper pulls from its page
+LINK = Spec(Field('href', 'a', {'class': 'js-inner-all-results-quote-item'}, attr='href'))
+GROWTH = Spec(Field('growth', 'p', {'data-cy-id': 'key-metric-value-forecasted-annual-earnings-growth'}, type=number))
+BETA = Spec(Field('beta', pattern=r"shows a Beta of ([+-]?\d+\.\d+).", type=float))
+I3NAME = Spec(Field('id', 'span', {'class': 'stname'}, type=i3_id))
+I3SUMMARY = Spec(
+    Field('header', 'div', {'id': 'headerAccordion'}, html=True, many=True),
+    Field('summary', 'div', {'id': 'summaryAccordion'}, html=True, many=True),
+)
+OVERVIEW = Spec(
+    Field('last_price', 'span', {'id': 'last_last'}),
+    Field('labels', 'span', {'class': 'float_lang_base_1'}, many=True),
+    Field('values', 'span', {'class': 'float_lang_base_2'}, many=True),
+    Field('pair_id', pattern=r'data-pair-id="(\d+)"'),
+)
+
+
 # Handle all methods related to stock
 class Stock:
-    def __init__(self, company):
-        self.urls = []
-        self.stock_cd = self.scrape_link(company)
-        print(f"Stock Cd: {self.stock_cd}")
+    # fetch stage: source -> sources it needs to be loaded first
+    sources = {
+        'link': [],
+        'overview': ['link'],
+        'growth_rate': ['link'],
+        'beta': ['link'],
+        'discount_rate': ['beta'],
+        'isummary': ['link'],
+        'ratios': ['link'],
+        'cash_flow': ['overview'],
+        'balance_sheet': ['overview'],
+    }
 
-        self.overview, self.stock_id, investing_url = self.scrape_overview()
-        print(f"Stock Id: {self.stock_id}")
+    # attributes each source loads
+    attributes = {
+        'link': ['stock_cd'],
+        'overview': ['overview', 'stock_id', 'investing_url'],
+        'growth_rate': ['growth_rate', 'simplywallst_url'],
+        'beta': ['beta', 'infrontanalytics_url'],
+        'discount_rate': ['discount_rate'],
+        'isummary': ['i3summary', 'i3business_performance', 'i3investor_url'],
+        'ratios': ['ratios'],
+        'cash_flow': ['cash_flow'],
+        'balance_sheet': ['balance_sheet'],
+    }
 
-        self.growth_rate, simplywallst_url = self.scrape_growth_rate()
-        self.beta, infrontanalytics_url = self.scrape_beta()
-        self.discount_rate = self.scrape_discount_rate()
-        self.i3summary, self.i3business_performance, i3investor_url = self.scrape_isummary()
-        self.urls.append(investing_url)
-        self.urls.append(simplywallst_url)
-        self.urls.append(infrontanalytics_url)
-        self.urls.append(i3investor_url)
-
-        self.ratios = self.scrape_ratios()
-        self.cash_flow = self.scrape_cash_flow()
-        self.balance_sheet = self.scrape_balance_sheet()
+    # identifier a source resolves, which the sources depending on it can take from the symbol table instead
+    identifiers = {
+        'link': 'stock_cd',
+        'overview': 'stock_id',
+    }
+
+    # symbols.Symbols shared by every stock, None to resolve every identifier on every run
+    symbols = None
+
+    # history.History to compute beta from stored prices, None to always scrape it
+    history = None
+
+    def __init__(self, company, max_workers=8, sources=None):
+        """scrape every source, or only the given ones (none with sources=[])"""
+
+        self.company = company
+        self.indexes = {}
+        self.fetch(sources, max_workers=max_workers)
         # self.income_statementp = Webpage.from_url(f"https://www.investing.com/equities/{stock_cd}-income-statement")
         # self.earningsp = Webpage.from_url(f"https://www.investing.com/equities/{stock_cd}-earnings")
         # self.financialp = Webpage.from_url(f"https://www.investing.com/equities/{stock_cd}-financial-summary")
 
+    @property
+    def urls(self):
+        return [getattr(self, name, None) for name in ['investing_url', 'simplywallst_url', 'infrontanalytics_url', 'i3investor_url']]
+
+    def plan(self, sources=None):
+        """{source: sources it still has to wait for} of the sources to load, all of them by default"""
+
+        if sources is None:
+            sources = list(self.sources)
+        reloaded = {name for source in sources for name in self.attributes[source]}
+        self.indexes = {key: items for key, items in self.indexes.items() if key[0] not in reloaded}
+        known = self.known_identifiers(sources)
+        return {source: [i for i in self.sources[source] if i in sources and i not in known] for source in sources}
+
+    def fetch(self, sources=None, max_workers=8):
+        """load sources concurrently, each one as soon as the sources it depends on are loaded"""
+
+        pending = self.plan(sources)
+        if not pending:
+            return
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"fetch-{self.company}") as pool:
+            while pending or running:
+                for source in [i for i in pending if not pending[i]]:
+                    del pending[source]
+                    running[pool.submit(contextvars.copy_context().run, self.load, source)] = source
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = running.pop(future)
+                    future.result()
+                    for deps in pending.values():
+                        if source in deps:
+                            deps.remove(source)
+
+    def known_identifiers(self, sources):
+        """sources whose identifier is in the symbol table, which is set on the stock so nothing waits for them"""
+
+        known = set()
+        if self.symbols is None:
+            return known
+        for source in sources:
+            key = self.identifiers.get(source)
+            value = key and self.symbols.get(self.company, key)
+            if value is not None:
+                setattr(self, key, value)
+                known.add(source)
+        return known
+
+    def symbol(self, key, search):
+        """identifier from the symbol table, or the result of the search() steps stored for next time"""
+
+        if self.symbols is not None:
+            value = self.symbols.cached(self.company, key, lambda: transport.run(search()))
+            if value is not None:
+                return value
+        value = yield from search()
+        if self.symbols is not None and value is not None:
+            self.symbols.put(self.company, key, value)
+        return value
+
+    def load(self, source):
+        """scrape one source, timed as the 'scrape' stage"""
+
+        current_stock.set(self.company)
+        current_source.set(source)
+        with recorder.stage('scrape'):
+            transport.run(getattr(self, 'load_' + source)())
+
+    def line_items(self, statement, column=1):
+        """LineItems of a statement attribute such as 'ratios', built once"""
+
+        key = (statement, column)
+        if key not in self.indexes:
+            with recorder.stage('extract', source=statement):
+                self.indexes[key] = LineItems(getattr(self, statement), column)
+        return self.indexes[key]
+
+    # load_* and scrape_* yield a transport.Fetch for every request and get its response back, run them with
+    # transport.run(stock.scrape_ratios()) or await aio.run(...)
+    def load_link(self):
+        self.stock_cd = yield from self.symbol('stock_cd', lambda: self.scrape_link(self.company))
+        print(f"Stock Cd: {self.stock_cd}")
+
+    def load_overview(self):
+        self.overview, self.stock_id, self.investing_url = yield from self.scrape_overview()
+        if self.symbols is not None and self.stock_id is not None:
+            self.symbols.put(self.company, 'stock_id', self.stock_id)
+        print(f"Stock Id: {self.stock_id}")
+
+    def load_growth_rate(self):
+        self.growth_rate, self.simplywallst_url = yield from self.scrape_growth_rate()
+
+    def load_beta(self):
+        beta = self.local_beta()
+        if beta is not None:
+            self.beta, self.infrontanalytics_url = beta, None
+            print(f"Beta: {beta} (price history)")
+            return
+        self.beta, self.infrontanalytics_url = yield from self.scrape_beta()
+
+    def load_discount_rate(self):
+        self.discount_rate = self.scrape_discount_rate()
+
+    def load_isummary(self):
+        self.i3summary, self.i3business_performance, self.i3investor_url = yield from self.scrape_isummary()
+
+    def load_ratios(self):
+        self.ratios = yield from self.scrape_ratios()
+
+    def load_cash_flow(self):
+        self.cash_flow = yield from self.scrape_cash_flow()
+
+    def load_balance_sheet(self):
+        self.balance_sheet = yield from self.scrape_balance_sheet()
+
     def scrape_link(self, company):
         headers = {
             'User-Agent': 'Mozilla/5.0',
@@ -80,19 +309,17 @@ class Stock:
         params = (
             ('q', company),
         )
-        response = requests.get('https://www.investing.com/search/', headers=headers, params=params)
-        soup = BeautifulSoup(response.text)
-        result = soup.find('a', ['js-inner-all-results-quote-item'])
-        stock_cd = result['href'].replace("/equities/", "")
+        response = yield Fetch('GET', 'https://www.investing.com/search/', headers=headers, params=params)
+        href = LINK.extract(response.text)['href']
+        stock_cd = href.replace("/equities/", "")
         return stock_cd
 
     """
     Simply Wall St
     """
-    def scrape_growth_rate(self):
-        """scrape growth rate from simply wall st"""
+    def search_simplywallst(self):
+        """simply wall st url of the stock, from their algolia search"""
 
-        # search the link for stock
         stock_cd = self.stock_cd.replace("-", " ")
         params = (
             ('x-algolia-agent', 'Algolia for JavaScript (4.2.0); Browser (lite)'),
@@ -101,79 +328,81 @@ class Stock:
         )
         data = f'{{"query":"{stock_cd} klse","highlightPostTag":" ","highlightPreTag":" ","restrictHighlightAndSnippetArrays":true}}'
         try:
-            response = requests.post('https://17iqhzwxzw-dsn.algolia.net/1/indexes/companies/query', params=params, data=data)
+            response = yield Fetch('POST', 'https://17iqhzwxzw-dsn.algolia.net/1/indexes/companies/query', params=params, data=data)
 
             # generate link
             stock_url = response.json()['hits'][0]['url']
-            url = "https://simplywall.st" + stock_url
+            return "https://simplywall.st" + stock_url
         except:
             return None
-        
-        html = url2html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        growth = soup.find('p', {'data-cy-id': 'key-metric-value-forecasted-annual-earnings-growth'}).get_text().replace('%', '')
-        self.growth_rate = float(growth) / 100
+
+    def scrape_growth_rate(self):
+        """scrape growth rate from simply wall st"""
+
+        url = yield from self.symbol('simplywallst_url', self.search_simplywallst)
+        if url is None:
+            return None
+
+        response = yield Fetch('GET', url)
+        self.growth_rate = GROWTH.extract(response.text)['growth']
         print(f"Growth Rate: {self.growth_rate}")
         return self.growth_rate, url
     
     """
     Infront Analytics
     """
-    def scrape_beta(self):
-        """scrape beta from infrontanalytics.com"""
+    def search_infrontanalytics(self):
+        """infrontanalytics beta page url of the stock, from their autocomplete"""
 
-        # search the link for stock
         params = (
             ('keyname', self.stock_cd.replace("-", " ")),
         )
-        response = requests.get('https://www.infrontanalytics.com/Eurofin/autocomplete', params=params, verify=False)
+        response = yield Fetch('GET', 'https://www.infrontanalytics.com/Eurofin/autocomplete', params=params, verify=False)
         result = response.json()[0]
 
         # generate stock url
         name = result['name'].replace(" ", "-").replace(".", "") + "-"
         code = result['isin']
-        url = f"https://www.infrontanalytics.com/fe-en/{code}/{name}/beta"
+        return f"https://www.infrontanalytics.com/fe-en/{code}/{name}/beta"
 
-        # get beta
-        html = url2html(url)
-        m = re.search(r"shows a Beta of ([+-]?\d+\.\d+).", html)
-        beta = m.groups()[0]
+    def scrape_beta(self):
+        """scrape beta from infrontanalytics.com"""
+
+        url = yield from self.symbol('infrontanalytics_url', self.search_infrontanalytics)
+
+        # get beta, reading the page only up to the sentence that has it
+        beta = (yield Fetch('GET', url, until=BETA, verify=False))['beta']
         print(f"Beta: {beta}")
-        return float(beta), url
+        return beta, url
     
+    def local_beta(self):
+        """rolling beta from the stored daily prices, None without a history or enough of it"""
+
+        if self.history is None:
+            return None
+        beta = self.history.betas([self.stock_cd])[0]
+        return None if pd.isna(beta) else float(beta)
+
     def scrape_discount_rate(self):
-        """convert beta to discount rate for dcf model"""
-        
-        discount_rate = 0
-        dr = {
-        0.8: 5, 
-        1: 6, 
-        1.1: 6.8, 
-        1.2: 7, 
-        1.3: 7.9, 
-        1.4: 8, 
-        1.5: 8.9
-        }
-        for key in dr:
-            if self.beta <= key:
-                discount_rate = dr[key]
-            else:
-                discount_rate = 9
-        discount_rate = round(discount_rate/100, 2)
+        """convert beta to discount rate for dcf model, through the bands of dcf.DISCOUNT_RATES"""
+
+        discount_rate = dcf.discount_rate(self.beta)
         print(f"Discount Rate: {discount_rate}")
         return discount_rate
 
     """
     i3investor
     """
-    def scrape_isummary(self):
+    def search_i3investor(self):
+        """i3investor's numeric id of the stock"""
+
         # search for link in the website
         headers = {'User-Agent': 'Mozilla'}
         params = (
             ('qt', 'lscomn'),
-            ('qp', 'nestle'),
+            ('qp', self.company),
         )
-        response = requests.get('https://klse.i3investor.com/cmservlet.jsp', headers=headers, params=params)
+        response = yield Fetch('GET', 'https://klse.i3investor.com/cmservlet.jsp', headers=headers, params=params)
         query = response.text.split(":")[0]
 
         # generate link to stock page
@@ -181,29 +410,27 @@ class Stock:
             ('sa', 'ss'),
             ('q', query),
         )
-        response = requests.get('https://klse.i3investor.com/quoteservlet.jsp', headers=headers, params=params)
+        response = yield Fetch('GET', 'https://klse.i3investor.com/quoteservlet.jsp', headers=headers, params=params)
 
         # scrape for id from stock page
-        html = response.text
-        soup = BeautifulSoup(html)
-        stock_name = soup.find('span', {'class': 'stname'}).text
-        stock_name = re.search("\((\d+)\)", stock_name)
-        stock_id = stock_name.groups()[0]
+        return I3NAME.extract(response.text)['id']
+
+    def scrape_isummary(self):
+        stock_id = yield from self.symbol('i3_id', self.search_i3investor)
 
         # generate link to summary page
         url = f"https://klse.i3investor.com/servlets/stk/fin/{stock_id}.jsp?type=summary"
-        html = url2html(url)
-        soup = BeautifulSoup(html)
+        response = yield Fetch('GET', url)
+        result = I3SUMMARY.extract(response.text)
 
         # get all summary tables
-        result = soup.find_all('div', {'id': 'headerAccordion'})
-        i3summary = pd.read_html(str(result[3]))[0]
+        i3summary = Statement.from_frame(pd.read_html(result['header'][3])[0], ('Value',))
 
         # get business performance tables
-        result = soup.find_all('div', {'id': 'summaryAccordion'})
-        business_performance_by_year = pd.read_html(str(result[1]))[0].dropna()
-        key_result = pd.read_html(str(result[2]))[0].dropna()
-        growth_by_year = pd.read_html(str(result[4]))[0].dropna()
+        result = result['summary']
+        business_performance_by_year = pd.read_html(result[1])[0].dropna()
+        key_result = pd.read_html(result[2])[0].dropna()
+        growth_by_year = pd.read_html(result[4])[0].dropna()
 
         i3business_performance = {
          "Business Peformance (by Year)": business_performance_by_year,
@@ -218,75 +445,51 @@ class Stock:
     """
     def scrape_overview(self):
         stock_cd = self.stock_cd
-        def scrape_id(overviewp):
-            m = re.search('data-pair-id="(\d+)"', overviewp.html)
-            stock_id = m.groups()[0]
-            return stock_id
-
         url = f"https://www.investing.com/equities/{stock_cd}"
-        overviewp = Webpage.from_url(url)
-        soup = overviewp.soup
-        last_price = soup.find('span', {'id':'last_last'}).get_text()
-        ls = ['Last Price', last_price]
-        df = pd.DataFrame([ls])
-        
-        overview = overviewp.get_span('span', ['float_lang_base_1', 'float_lang_base_2'])
-        stock_id = scrape_id(overviewp)
+        result = OVERVIEW.extract((yield Fetch('GET', url)).text)
+        labels = ['Last Price'] + result['labels']
+        rows = [[result['last_price']]] + [[i] for i in result['values']]
+        overview = Statement.from_rows(labels, rows, ('Value',))
+        stock_id = result['pair_id']
 
-        return pd.concat([df, overview]), stock_id, url
+        return overview, stock_id, url
     
     def scrape_ratios(self):
         stock_cd = self.stock_cd
-        ratiosp = Webpage.from_url(f"https://www.investing.com/equities/{stock_cd}-ratios")
-        tables = ratiosp.tables
-        numbers = range(1, 9)
-        ratios = pd.concat(tables[i] for i in numbers)
-        return ratios
+        with Webpage((yield Fetch('GET', f"https://www.investing.com/equities/{stock_cd}-ratios")).text) as ratiosp:
+            tables = ratiosp.tables
+            numbers = range(1, 9)
+            ratios = pd.concat(tables[i] for i in numbers)
+            return Statement.from_frame(ratios, ('Company', 'Industry'))
     
     def scrape_cash_flow(self):
         stock_id = self.stock_id
-        cash_flowp = Webpage.from_url(f"https://www.investing.com/instruments/Financials/changereporttypeajax?action=change_report_type&pair_ID={self.stock_id}&report_type=CAS&period_type=Annual")
-        df = cash_flowp.tables[0]
-        cash_flow = df[~df[1].str.contains("a|e|i|o|u")]
-        return cash_flow
+        with Webpage((yield Fetch('GET', f"https://www.investing.com/instruments/Financials/changereporttypeajax?action=change_report_type&pair_ID={self.stock_id}&report_type=CAS&period_type=Annual")).text) as cash_flowp:
+            return Statement.from_periods(cash_flowp.table(0))
     
     def scrape_balance_sheet(self):
         stock_id = self.stock_id
-        balance_sheetp = Webpage.from_url(f"https://www.investing.com/instruments/Financials/changereporttypeajax?action=change_report_type&pair_ID={self.stock_id}&report_type=BAL&period_type=Annual")
-        df = balance_sheetp.tables[0]
-        balance_sheet = df[~df[1].str.contains("a|e|i|o|u")]
-        return balance_sheet
+        with Webpage((yield Fetch('GET', f"https://www.investing.com/instruments/Financials/changereporttypeajax?action=change_report_type&pair_ID={self.stock_id}&report_type=BAL&period_type=Annual")).text) as balance_sheetp:
+            return Statement.from_periods(balance_sheetp.table(0))
     
     def scrape_earnings(self):
         stock_cd = self.stock_cd
-        s = requests.Session()
         url = f"https://www.investing.com/equities/{self.stock_cd}-earnings"
         headers={ "User-Agent": "Mozilla/5.0"}
-        r = s.get(url, headers={ "User-Agent": "Mozilla/5.0"})
-        
-        # get more history - to work on
-        '''
-        more_history = "https://www.investing.com/equities/morehistory"
-        headers = {
-            'User-Agent': 'Mozilla/5.0',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': url,
-        }
-        data = {"pairID" : "41688", "last_timestamp": "2019-0-02"}
-        r = s.post(more_history, headers=headers, cookies=r.cookies, data=data)
-        r.json()['historyRows']
-        '''
+        r = yield Fetch('GET', url, headers=headers)
+
+        # older releases, from the morehistory pages: history.History.update_earnings
         return r.text
     
     def scrape_financial_summary(self):
         def get_summary(html):
-            webpage = Webpage(html)
-            soup = webpage.soup
+            with Webpage(html) as webpage:
+                soup = webpage.soup
 
-            title = soup.find('h3').text
-            df = webpage.get_span('span', ['float_lang_base_1', 'float_lang_base_2'])
-            table = pd.read_html(str(soup))[0]
-            return [title, table, df] # pd.concat([table, df], axis=0, ignore_index=True)
+                title = soup.find('h3').text
+                df = webpage.get_span('span', ['float_lang_base_1', 'float_lang_base_2'])
+                table = pd.read_html(str(soup))[0]
+                return [title, table, df] # pd.concat([table, df], axis=0, ignore_index=True)
         
         stock_id = self.stock_id
         financial_summary = f"https://www.investing.com/instruments/Financials/changesummaryreporttypeajax?action=change_report_type&pid={stock_id}&financial_id={stock_id}&ratios_id={stock_id}&period_type="
@@ -294,12 +497,12 @@ class Stock:
         # interim = financial_summary + "Interim"
         
         df = pd.DataFrame()
-        soup = Webpage.from_url(annual).soup
-        sections = soup.find_all('div', "companySummaryIncomeStatement")
-        result = []
-        for i in sections:
-            result.append(get_summary(str(i)))
-        return result
+        with Webpage((yield Fetch('GET', annual)).text) as page:
+            sections = page.soup.find_all('div', "companySummaryIncomeStatement")
+            result = []
+            for i in sections:
+                result.append(get_summary(str(i)))
+            return result
             
 '''
 10% for public companies
@@ -0,0 +1,318 @@
+"""
+Local SQLite store of scraped fundamentals.
+
+Every scraped source of a stock is kept as json, one row per stock, source
+and fetch date, so a Stock can be rebuilt without scraping and only its
+stale sources refreshed. The key figures of each stock are also flattened
+into the fundamentals table, one row per stock per date, indexed on
+stock_cd and date, which screener.Screener screens:
+
+    Screener.from_store(store).screen("pb < 1 and roe > 0.1")
+
+The reports table keeps the fingerprint of every input of a stock's last
+report, so a report whose inputs are all unchanged isn't made again.
+
+stock.py (bs4, requests) and report.py (xlsxwriter) are only imported by
+what scrapes or fingerprints, so screens and stored valuations that only
+read the database don't load them.
+"""
+import json
+import time
+import hashlib
+import sqlite3
+import datetime
+import threading
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+import dcf
+from statements import Statement
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# seconds before a stored source is scraped again
+TTLS = {
+    'link': 30 * DAY,
+    'overview': HOUR,
+    'growth_rate': DAY,
+    'beta': 7 * DAY,
+    'discount_rate': 0,  # derived from beta, recomputed on every refresh
+    'isummary': DAY,
+    'ratios': DAY,
+    'cash_flow': 7 * DAY,
+    'balance_sheet': 7 * DAY,
+}
+
+# fundamentals column, statement, line item
+METRICS = [
+    ('last_price', 'overview', 'Last Price'),
+    ('shares_outstanding', 'overview', 'Shares Outstanding'),
+    ('operating_cash_flow', 'cash_flow', 'Cash From Operating Activities'),
+    ('total_debt', 'balance_sheet', 'Total Long Term Debt'),
+    ('cash', 'balance_sheet', 'Cash & Equivalent'),
+    ('total_assets', 'balance_sheet', 'Total Assets'),
+    ('total_liabilities', 'balance_sheet', 'Total Liabilities'),
+    ('total_equity', 'balance_sheet', 'Total Equity'),
+    ('common_shares', 'balance_sheet', 'Total Common Shares Outstanding'),
+    ('eps', 'ratios', 'Basic EPS ANN'),
+    ('eps_mrq_growth', 'ratios', r'EPS\(MRQ\) vs Qtr. 1 Yr. Ago MRQ'),
+    ('eps_ttm_growth', 'ratios', r'EPS\(TTM\) vs TTM 1 Yr. Ago TTM'),
+    ('eps_growth_5y', 'ratios', '5 Year EPS Growth 5YA'),
+    ('roe', 'ratios', 'Return on Equity TTM'),
+    ('roe_5y', 'ratios', 'Return on Equity 5YA'),
+    ('pe', 'ratios', 'P/E Ratio TTM'),
+    ('dividend_yield', 'ratios', 'Dividend Yield ANN'),
+    ('dividend_yield_5y', 'ratios', 'Dividend Yield 5 Year Avg. 5YA'),
+    ('dividend_growth', 'ratios', 'Dividend Growth Rate ANN'),
+    ('pb', 'ratios', 'Price to Book MRQ'),
+    ('lt_debt_to_equity', 'ratios', 'LT Debt to Equity'),
+]
+COLUMNS = ['growth_rate', 'beta', 'discount_rate'] + [i[0] for i in METRICS] + ['nav_per_share', 'npv']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS companies (
+    company TEXT PRIMARY KEY,
+    stock_cd TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    stock_cd TEXT NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (stock_cd, source, date)
+);
+CREATE TABLE IF NOT EXISTS fundamentals (
+    stock_cd TEXT NOT NULL,
+    date TEXT NOT NULL,
+    company TEXT,
+    {', '.join(f'{column} REAL' for column in COLUMNS)},
+    PRIMARY KEY (stock_cd, date)
+);
+CREATE INDEX IF NOT EXISTS fundamentals_date ON fundamentals (date);
+CREATE TABLE IF NOT EXISTS reports (
+    company TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    result TEXT NOT NULL,
+    made REAL NOT NULL
+);
+CREATE VIEW IF NOT EXISTS latest AS
+    SELECT * FROM fundamentals f WHERE date = (SELECT MAX(date) FROM fundamentals WHERE stock_cd = f.stock_cd);
+"""
+
+
+# how a frame stored before the statements were typed becomes a Statement
+STATEMENTS = {
+    'overview': lambda df: Statement.from_frame(df, ('Value',)),
+    'ratios': lambda df: Statement.from_frame(df, ('Company', 'Industry')),
+    'cash_flow': Statement.from_periods,
+    'balance_sheet': Statement.from_periods,
+    'i3summary': lambda df: Statement.from_frame(df, ('Value',)),
+}
+
+
+def encode(value):
+    if isinstance(value, Statement):
+        return {'statement': value.state()}
+    if isinstance(value, pd.DataFrame):
+        return {'frame': value.to_json(orient='split')}
+    if isinstance(value, dict):
+        return {'frames': {key: encode(i) for key, i in value.items()}}
+    return {'value': value}
+
+
+def decode(value):
+    if 'statement' in value:
+        return Statement.from_state(value['statement'])
+    if 'frame' in value:
+        return pd.read_json(StringIO(value['frame']), orient='split', dtype=False)
+    if 'frames' in value:
+        return {key: decode(i) for key, i in value['frames'].items()}
+    return value['value']
+
+
+def number(value):
+    return value if isinstance(value, float) else None
+
+
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def fingerprint(stock):
+    """(digest of them all, {input: digest}) of every scraped attribute, the template and the dcf settings"""
+
+    import report
+    from stock import Stock
+
+    inputs = {name: digest(encode(getattr(stock, name, None)))
+              for names in Stock.attributes.values() for name in names}
+    inputs['template'] = digest(report.TEMPLATE_VERSION)
+    inputs['dcf'] = digest([dcf.DISCOUNT_RATES, dcf.ABOVE, list(report.growth_offsets), list(report.discount_rates)])
+    return digest(inputs), inputs
+
+
+def fundamentals(stock):
+    """{column: value} of the key figures of a stock, None where missing"""
+
+    row = {'growth_rate': stock.growth_rate, 'beta': stock.beta, 'discount_rate': stock.discount_rate}
+    for column, statement, term in METRICS:
+        try:
+            row[column] = number(stock.line_items(statement).search(term))
+        except (KeyError, AttributeError):
+            row[column] = None
+    if row['shares_outstanding'] is not None:
+        row['shares_outstanding'] /= 1000000  # millions, like the statements
+
+    try:
+        row['nav_per_share'] = (row['total_assets'] - row['total_liabilities']) / row['common_shares']
+    except (TypeError, ZeroDivisionError):
+        row['nav_per_share'] = None
+    try:
+        row['npv'] = float(dcf.npv_per_share(row['operating_cash_flow'], row['shares_outstanding'],
+                                             row['growth_rate'], row['discount_rate'])[0, 0, 0, 0])
+    except (TypeError, ValueError):
+        row['npv'] = None
+    return row
+
+
+class Store:
+    def __init__(self, path='stocks.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def save(self, stock, sources=None):
+        """store the given sources (default all) of a stock and its key figures for today"""
+
+        from stock import Stock
+
+        if sources is None:
+            sources = list(Stock.sources)
+        date = datetime.date.today().isoformat()
+        now = time.time()
+        rows = []
+        for source in sources:
+            data = {name: encode(getattr(stock, name)) for name in Stock.attributes[source]}
+            rows.append((stock.stock_cd, source, date, now, json.dumps(data)))
+        row = fundamentals(stock)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO companies VALUES (?, ?)", (stock.company, stock.stock_cd))
+            self.connection.executemany("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO fundamentals (stock_cd, date, company, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in COLUMNS)})",
+                [stock.stock_cd, date, stock.company] + [row[column] for column in COLUMNS])
+
+    def stock_cd(self, company):
+        with self.lock:
+            row = self.connection.execute("SELECT stock_cd FROM companies WHERE company = ?", (company,)).fetchone()
+        return row and row[0]
+
+    def fetched(self, stock_cd):
+        """{source: time of the latest fetch}"""
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT source, MAX(fetched) FROM sources WHERE stock_cd = ? GROUP BY source", (stock_cd,)).fetchall()
+        return dict(rows)
+
+    def load(self, company):
+        """Stock rebuilt from the latest stored sources, None if it was never stored"""
+
+        from stock import Stock
+
+        stock_cd = self.stock_cd(company)
+        if stock_cd is None:
+            return None
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT source, data FROM sources s WHERE stock_cd = ? AND fetched = "
+                "(SELECT MAX(fetched) FROM sources WHERE stock_cd = s.stock_cd AND source = s.source)",
+                (stock_cd,)).fetchall()
+        stock = Stock(company, sources=[])
+        for source, data in rows:
+            for name, value in json.loads(data).items():
+                value = decode(value)
+                if name in STATEMENTS and isinstance(value, pd.DataFrame):
+                    value = STATEMENTS[name](value)
+                setattr(stock, name, value)
+        stock.stock_cd = stock_cd
+        return stock
+
+    def stale(self, stock_cd, ttls=TTLS):
+        """sources of a stock that were never stored or are older than their ttl"""
+
+        from stock import Stock
+
+        fetched = self.fetched(stock_cd)
+        now = time.time()
+        return [source for source in Stock.sources if now - fetched.get(source, 0) >= ttls[source]]
+
+    def refresh(self, company, max_workers=8):
+        """Stock with only its stale sources scraped again, stored back"""
+
+        from stock import Stock
+
+        stock = self.load(company)
+        if stock is None:
+            stock = Stock(company, max_workers=max_workers)
+            self.save(stock)
+            return stock
+        stale = self.stale(stock.stock_cd)
+        stock.fetch(stale, max_workers=max_workers)
+        self.save(stock, stale)
+        return stock
+
+    def report(self, company):
+        """(fingerprint, {input: digest}, result) of the last report of a company, None if there is none"""
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fingerprint, inputs, result FROM reports WHERE company = ?", (company,)).fetchone()
+        return row and (row[0], json.loads(row[1]), json.loads(row[2]))
+
+    def save_report(self, company, fingerprint, inputs, result):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?)",
+                                    (company, fingerprint, json.dumps(inputs), json.dumps(result), time.time()))
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return pd.read_sql_query(sql, self.connection, params=params)
+
+    def revalue(self, history, window=252):
+        """
+        beta, discount rate and npv of the latest fundamentals of every stored stock again from
+        the price history (a history.History), in one pass over all of them; stocks without
+        enough history keep their beta
+        """
+        latest = self.query("SELECT * FROM latest ORDER BY stock_cd")
+        if latest.empty:
+            return latest
+        betas = history.betas(list(latest.stock_cd), window)
+        latest['beta'] = np.where(np.isnan(betas), latest.beta.astype(float), betas)
+        latest['discount_rate'] = dcf.discount_rate(latest.beta)
+        latest['npv'] = dcf.npv_per_share(latest.operating_cash_flow.astype(float),
+                                          latest.shares_outstanding.astype(float),
+                                          latest.growth_rate.astype(float).values[:, None],
+                                          latest.discount_rate.values[:, None])[:, 0, 0, 0]
+        rows = latest[['beta', 'discount_rate', 'npv', 'stock_cd', 'date']].astype(object)
+        rows = rows.where(pd.notna(rows), None)
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE fundamentals SET beta = ?, discount_rate = ?, npv = ? WHERE stock_cd = ? AND date = ?",
+                rows.itertuples(index=False, name=None))
+        return latest
+
+    def history(self, stock_cd):
+        return self.query("SELECT * FROM fundamentals WHERE stock_cd = ? ORDER BY date", (stock_cd,))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,134 @@
+"""
+Persistent table of the identifiers each site knows a company by.
+
+Finding a stock on every site takes a search round trip per site (investing
+search, Algolia, the infrontanalytics autocomplete and two i3investor
+lookups) although the answers practically never change. Symbols keeps them
+per company in SQLite, so they are resolved once:
+
+    symbols.resolve('airasia', 'stock_cd', lambda: transport.run(stock.scrape_link('airasia')))
+
+Entries older than ttl are resolved again before use, or with
+revalidate=True served as they are while a background thread resolves them
+again.
+"""
+import time
+import sqlite3
+import threading
+import contextvars
+
+DAY = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbols (
+    company TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    resolved REAL NOT NULL,
+    PRIMARY KEY (company, key)
+);
+"""
+
+
+class Symbols:
+    def __init__(self, path='stocks.db', ttl=90 * DAY, revalidate=False):
+        self.path = path
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.revalidating = {}  # (company, key) -> thread
+
+    def row(self, company, key):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT value, resolved FROM symbols WHERE company = ? AND key = ?", (company, key)).fetchone()
+
+    def stale(self, resolved):
+        return self.ttl is not None and time.time() - resolved >= self.ttl
+
+    def get(self, company, key):
+        """stored identifier, None if there is none or it is stale and not revalidated in the background"""
+
+        row = self.row(company, key)
+        if row is None or (self.stale(row[1]) and not self.revalidate):
+            return None
+        return row[0]
+
+    def put(self, company, key, value):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO symbols VALUES (?, ?, ?, ?)",
+                                    (company, key, str(value), time.time()))
+
+    def forget(self, company, key=None):
+        """drop the identifiers of a company (or one of them), e.g. after a site renamed it"""
+
+        with self.lock, self.connection:
+            if key is None:
+                self.connection.execute("DELETE FROM symbols WHERE company = ?", (company,))
+            else:
+                self.connection.execute("DELETE FROM symbols WHERE company = ? AND key = ?", (company, key))
+
+    def cached(self, company, key, resolver=None):
+        """stored identifier, None if there is none or it is stale, unless a resolver is given to revalidate it"""
+
+        row = self.row(company, key)
+        if row is None:
+            return None
+        if not self.stale(row[1]):
+            return row[0]
+        if self.revalidate and resolver is not None:
+            self.revalidate_later(company, key, resolver, row[0])
+            return row[0]
+        return None
+
+    def resolve(self, company, key, resolver):
+        """stored identifier, or resolver() stored for next time"""
+
+        value = self.cached(company, key, resolver)
+        if value is None:
+            value = resolver()
+            if value is not None:
+                self.put(company, key, value)
+        return value
+
+    def revalidate_later(self, company, key, resolver, old):
+        """resolve again in a background thread, at most once at a time per identifier"""
+
+        def run():
+            try:
+                value = resolver()
+                if value is not None:
+                    if str(value) != old:
+                        print(f"{company}: {key} changed from {old} to {value}")
+                    self.put(company, key, value)
+            except Exception as e:
+                print(f"{company}: revalidating {key} failed with {e!r}")
+            finally:
+                with self.lock:
+                    self.revalidating.pop((company, key), None)
+
+        with self.lock:
+            if (company, key) in self.revalidating:
+                return
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True,
+                                      name=f"revalidate-{company}-{key}")
+            self.revalidating[(company, key)] = thread
+        thread.start()
+
+    def items(self, company):
+        """{key: value} of everything stored for a company"""
+
+        with self.lock:
+            return dict(self.connection.execute("SELECT key, value FROM symbols WHERE company = ?", (company,)))
+
+    def close(self):
+        """wait for background revalidations, then close the table"""
+
+        with self.lock:
+            threads = list(self.revalidating.values())
+        for thread in threads:
+            thread.join()
+        self.connection.close()
@@ -0,0 +1,318 @@
+"""
+Shared http transport for every scraper.
+
+One keep-alive requests.Session per host with a bounded connection pool,
+timeouts on every request, retries with exponential backoff and jitter on
+connection errors and throttling/server errors, and per-host rate limits.
+With a cache.HttpCache attached, responses are served from disk while fresh.
+Block and captcha pages, streamed ones included, are retried like throttling
+and then raise Blocked, and throttling or server errors left after the
+retries raise requests.HTTPError, so error pages are never cached or parsed
+into numbers. Every answer is reported to the rate
+limiter, which scheduler.AdaptiveLimiter adapts its rates from.
+
+Scrapers are generators that yield a Fetch for every request and get its
+response sent back; run() drives one with blocking requests, aio.py drives
+the same generators on an event loop.
+"""
+import re
+import time
+import types
+import random
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import CacheMiss
+from instrument import recorder
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHUNK = 16 * 1024  # bytes read at a time from streamed bodies
+
+# what the anti-bot walls of the scraped sites answer instead of the page
+BLOCK_STATUS = {403, 429}
+BLOCK_TITLE = re.compile(r'<title>[^<]*(just a moment|attention required|access denied|pardon our interruption|'
+                         r'are you a (?:human|robot)|security check|captcha|request unsuccessful)', re.I)
+BLOCK_MARKER = re.compile(r'g-recaptcha|h-captcha|cf-chl-|px-captcha|distil_r_captcha|_Incapsula_Resource', re.I)
+BLOCK_PAGE = 32 * 1024  # pages asked for are bigger, markers are only looked for in pages up to this size
+
+
+class Blocked(Exception):
+    """a site answered with a block or captcha page instead of the page asked for"""
+
+
+def block_reason(start, whole):
+    """why a page starting with the text start (all of it when whole) is a block or captcha page, None if it isn't"""
+
+    m = BLOCK_TITLE.search(start)
+    if m:
+        return m.group(1).lower()
+    if whole:
+        m = BLOCK_MARKER.search(start)
+        if m:
+            return m.group(0).lower()
+    return None
+
+
+def blocked(response, stream=False):
+    """why a response is a block or captcha page, None if it isn't; only its status if the body is streamed"""
+
+    if response.status_code in BLOCK_STATUS:
+        return f"status {response.status_code}"
+    if stream:
+        return None
+    return block_reason(response.content[:BLOCK_PAGE].decode('latin-1'), len(response.content) <= BLOCK_PAGE)
+
+
+def check_page(start, whole):
+    """Spec.extract_chunks check that raises Blocked on the start of a block or captcha page"""
+
+    reason = block_reason(start, whole)
+    if reason is not None:
+        raise Blocked(reason)
+
+
+def failed(response):
+    """a throttling or server error status the retries didn't get past"""
+
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class RateLimiter:
+    """space out requests to the same host, shared by every thread"""
+
+    def __init__(self, rate=None, rates=None):
+        self.rate = rate  # requests per second per host, None for no limit
+        self.rates = rates or {}  # per host overrides
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, url):
+        """take the next free slot of the host of url, seconds until it comes"""
+
+        host = urlsplit(url).netloc
+        rate = self.rates.get(host, self.rate)
+        if not rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + 1 / rate
+        return slot - now
+
+    def wait(self, url):
+        time.sleep(self.reserve(url))
+
+    def ready_in(self, host):
+        """seconds until the host's next free slot, without taking it"""
+
+        with self.lock:
+            return max(0, self.next_slot.get(host, 0) - time.monotonic())
+
+    def feedback(self, url, status, seconds, reason=None, retry_after=None):
+        """how a request to url went: status (None when it didn't connect), seconds, why it was blocked"""
+
+
+class Fetch:
+    """a request a scraper yields, answered with its response, or with until.extract_chunks of the streamed body"""
+
+    def __init__(self, method, url, headers=None, params=None, data=None, until=None, **kwargs):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.params = params
+        self.data = data
+        self.until = until  # extract.Spec of regex fields, the body is read only until they all matched
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return f"Fetch({self.method} {self.url})"
+
+
+class Transport:
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, timeout=(5, 30), pool_size=16, rate=None, rates=None, cache=None):
+        self.retries = retries  # retries after the first attempt
+        self.backoff = backoff  # seconds before the first retry, doubled for every retry after
+        self.max_backoff = max_backoff
+        self.timeout = timeout  # (connect, read) seconds
+        self.pool_size = pool_size  # keep-alive connections per host
+        self.headers = {'User-Agent': 'Mozilla/5.0'}
+        self.rate_limiter = RateLimiter(rate, rates)
+        self.cache = cache  # cache.HttpCache or None
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, url):
+        """keep-alive session for the host of url"""
+
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(self.headers)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def delay(self, attempt, response=None):
+        """seconds to wait before retry number attempt"""
+
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    @staticmethod
+    def retry_after(response):
+        value = response is not None and response.headers.get('Retry-After')
+        return float(value) if value and value.isdigit() else None
+
+    def request(self, method, url, headers=None, params=None, data=None, **kwargs):
+        """cached_request, recording the status, size and retries of the response"""
+
+        with recorder.stage('fetch', host=urlsplit(url).netloc) as record:
+            response = self.cached_request(method, url, headers, params, data, **kwargs)
+            self.record(record, response, kwargs.get('stream'))
+            return response
+
+    @staticmethod
+    def record(record, response, stream=False):
+        if recorder.enabled:
+            record['status'] = response.status_code
+            record['retries'] = getattr(response, 'retries', 0)
+            record['cached'] = getattr(response, 'from_cache', False)
+            if stream and not record['cached']:
+                record['bytes'] = int(response.headers.get('Content-Length') or 0)
+            else:
+                record['bytes'] = len(response.content)
+
+    def cached_request(self, method, url, headers=None, params=None, data=None, **kwargs):
+        """answer from the cache when fresh, otherwise send (or revalidate) and store the response"""
+
+        key, entry, response, headers = self.lookup(method, url, headers, params, data)
+        if response is not None:
+            return response
+        response = self.send(method, url, headers, params, data, **kwargs)
+        return self.store(key, entry, url, response)
+
+    def lookup(self, method, url, headers=None, params=None, data=None):
+        """(key, entry, cached response or None, headers with validators for a stale entry)"""
+
+        if self.cache is None:
+            return None, None, None, headers
+        key = self.cache.key(method, url, params, data)
+        entry = self.cache.get(key)
+        if entry is not None:
+            response = self.cache.response(*entry)
+            if blocked(response) is not None:
+                entry = None  # a block page cached before they were told apart
+            elif self.cache.offline or self.cache.fresh(entry[0]):
+                return key, entry, response, headers
+        if self.cache.offline:
+            raise CacheMiss(f"{method} {url} {params or ''} is not cached")
+        if entry is not None:
+            headers = {**(headers or {}), **self.cache.validators(entry[0])}
+        return key, entry, None, headers
+
+    def store(self, key, entry, url, response):
+        """cache a downloaded response, or the cached one again when it came back 304"""
+
+        if self.cache is None:
+            return response
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidated(key, entry[0])
+            return self.cache.response(*entry)
+        if response.status_code == 200 and blocked(response) is None:
+            self.cache.put(key, url, response)
+        return response
+
+    def send(self, method, url, headers=None, params=None, data=None, until=None, **kwargs):
+        """
+        send a request, retrying connection errors, retryable statuses and block pages; with
+        until (an extract.Spec) the body is streamed into its fields, set as response.fields
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if until is not None:
+            kwargs['stream'] = True
+        session = self.session(url)
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(url)
+            start = time.monotonic()
+            try:
+                response = session.request(method, url, headers=headers, params=params, data=data, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.rate_limiter.feedback(url, None, time.monotonic() - start)
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+            reason = blocked(response, kwargs.get('stream'))
+            fields = None
+            if reason is None and until is not None and response.status_code not in RETRY_STATUS:
+                try:
+                    fields = until.extract_chunks(response.iter_content(chunk_size=CHUNK, decode_unicode=True),
+                                                  check=check_page, head=BLOCK_PAGE)
+                except Blocked as e:
+                    reason = str(e)
+                finally:
+                    response.close()
+            self.rate_limiter.feedback(url, response.status_code, time.monotonic() - start, reason,
+                                       self.retry_after(response))
+            if (reason is None and response.status_code not in RETRY_STATUS) or attempt == self.retries:
+                if reason is not None:
+                    response.close()
+                    raise Blocked(f"{method} {url}: {reason}")
+                if failed(response):
+                    response.close()
+                    response.raise_for_status()
+                response.retries = attempt
+                response.fields = fields
+                return response
+            response.close()
+            time.sleep(self.delay(attempt, response))
+
+    def get(self, url, headers=None, params=None, data=None, **kwargs):
+        return self.request('GET', url, headers=headers, params=params, data=data, **kwargs)
+
+    def post(self, url, headers=None, params=None, data=None, **kwargs):
+        return self.request('POST', url, headers=headers, params=params, data=data, **kwargs)
+
+    def run(self, steps):
+        """drive a scraper generator, sending back the answer to every Fetch it yields, to its result"""
+
+        if not isinstance(steps, types.GeneratorType):
+            return steps  # steps that fetch nothing
+        try:
+            fetch = next(steps)
+            while True:
+                fetch = steps.send(self.answer(fetch))
+        except StopIteration as stop:
+            return stop.value
+
+    def answer(self, fetch):
+        """
+        the response to a Fetch, or with until the fields of its body. Only without a cache is
+        the body streamed and read just until they all matched: cache.put stores the whole body
+        """
+        if fetch.until is None:
+            return self.request(fetch.method, fetch.url, fetch.headers, fetch.params, fetch.data, **fetch.kwargs)
+        if self.cache is not None:
+            response = self.request(fetch.method, fetch.url, fetch.headers, fetch.params, fetch.data, **fetch.kwargs)
+            return fetch.until.extract_chunks(response.iter_content(chunk_size=CHUNK, decode_unicode=True))
+        response = self.request(fetch.method, fetch.url, fetch.headers, fetch.params, fetch.data,
+                                stream=True, until=fetch.until, **fetch.kwargs)
+        return response.fields
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+transport = Transport()